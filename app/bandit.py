@@ -0,0 +1,107 @@
+"""
+Exploration/exploitation over genres with per-user Thompson sampling.
+
+Each genre is an arm with a Beta(1 + likes, 2 + passes) posterior per user. The counters are a
+compact (num_arms, 2) uint32 array per user, kept in an LRU store and updated in O(1) by the
+like/pass endpoints. /recommend samples the posteriors to split the ranked list into per-genre
+quotas before retrieval (see Recommender.rank), so genres a user keeps passing on shrink and
+untried genres still get occasional slots.
+
+Counters are rebuilt from the user's history (already fetched by /recommend) whenever they
+disagree with it, e.g. after a restart or when another API process handled the swipe.
+"""
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Prior Beta(1, 2): before any feedback a genre is assumed to be passed more often than liked,
+# which keeps untried genres from crowding out ones the user has liked.
+PRIOR_LIKES = 1.0
+PRIOR_PASSES = 2.0
+
+def counts_from_history(book_arms, book_id_to_idx, num_arms, liked_ids, seen_ids):
+    """(num_arms, 2) [likes, passes] counters from a user's history."""
+    liked = set(liked_ids)
+    like_rows = [book_id_to_idx[b] for b in liked if b in book_id_to_idx]
+    pass_rows = [book_id_to_idx[b] for b in seen_ids if b not in liked and b in book_id_to_idx]
+    counts = np.zeros((num_arms, 2), dtype=np.uint32)
+    for col, rows in ((0, like_rows), (1, pass_rows)):
+        arms = book_arms[rows] if rows else np.empty(0, dtype=np.int64)
+        arms = arms[arms >= 0]
+        counts[:, col] = np.bincount(arms, minlength=num_arms)
+    return counts
+
+def thompson_quotas(counts, size, rng=None):
+    """
+    Per-slot Thompson sampling: every one of the `size` slots draws one sample per arm and goes
+    to the arm with the highest draw. Returns an int array (num_arms,) summing to size.
+    """
+    rng = rng or np.random.default_rng()
+    theta = rng.beta(PRIOR_LIKES + counts[:, 0], PRIOR_PASSES + counts[:, 1], size=(size, len(counts)))
+    return np.bincount(theta.argmax(axis=1), minlength=len(counts))
+
+def fill_quotas(arms, quotas, size):
+    """
+    arms: arm per candidate, in score order (-1 = unknown genre).
+    Picks up to size positions: the best-scored candidates of each arm up to its quota, then
+    tops up with the best remaining candidates if some arms could not fill theirs.
+    Returns positions in score order.
+    """
+    n = len(arms)
+    # Rank of each candidate within its own arm, keeping score order
+    by_arm = np.argsort(arms, kind="stable")
+    sorted_arms = arms[by_arm]
+    within = np.empty(n, dtype=np.int64)
+    within[by_arm] = np.arange(n) - np.searchsorted(sorted_arms, sorted_arms)
+
+    known = arms >= 0
+    in_quota = known & (within < quotas[np.where(known, arms, 0)])
+    picked = np.flatnonzero(in_quota)[:size]
+    if len(picked) < size:
+        rest = np.flatnonzero(~in_quota)[:size - len(picked)]
+        picked = np.sort(np.concatenate([picked, rest]))
+    return picked
+
+class BanditStore:
+    def __init__(self, max_users=100000):
+        self.max_users = max_users
+        # user_id -> (counts, total swipes counted)
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, user_id, arm, liked):
+        """O(1) update from a like/pass. Users not in memory are rebuilt on their next /recommend."""
+        if arm < 0:
+            return
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return
+            entry[0][arm, 0 if liked else 1] += 1
+            entry[1] += 1
+
+    def counts(self, user_id, num_seen, rebuild):
+        """
+        Counters for user_id. `rebuild()` recomputes them from history and is only called when
+        the stored total disagrees with num_seen (the user's swipe count).
+        """
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry[1] == num_seen:
+                self._users.move_to_end(user_id)
+                return entry[0].copy()
+
+        counts = rebuild()
+        with self._lock:
+            self._users[user_id] = [counts, num_seen]
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return counts.copy()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "bytes": sum(entry[0].nbytes for entry in self._users.values()),
+            }
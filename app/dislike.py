@@ -0,0 +1,67 @@
+"""
+Per-user "dislike" profile built from pass actions.
+
+The dislike vector is the mean embedding of the books a user passed on. RankerInference.predict_score
+penalizes candidates by their similarity to it, so near-duplicates of rejected books sink instead of
+coming back on the next page. The vector is not normalized: passes spread over many topics average
+out to a short vector (weak penalty), passes on one author or series give a long one (strong penalty).
+
+Like BanditStore, the running sum and pass count per user live in a bounded in-process LRU, are
+updated in O(1) by /pass and are rebuilt from the history /recommend already loads whenever the
+swipe count disagrees with them (restart, or another API process handled the swipe).
+"""
+import threading
+from collections import OrderedDict
+import numpy as np
+
+def dislike_vector(total, passes):
+    """Mean passed-book embedding, or None without passes."""
+    if passes == 0:
+        return None
+    return (total / passes).astype(np.float32)
+
+class DislikeStore:
+    def __init__(self, max_users=20000):
+        # One float32 vector per user (1.5 KB at 384 dims), so this bounds memory at ~30 MB
+        self.max_users = max_users
+        # user_id -> [embedding sum, passes, total swipes counted]
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, user_id, embedding, liked):
+        """O(1) update from a like/pass. Users not in memory are rebuilt on their next /recommend."""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return
+            if not liked:
+                entry[0] += embedding
+                entry[1] += 1
+            entry[2] += 1
+
+    def profile(self, user_id, num_seen, rebuild):
+        """
+        Dislike vector for user_id, or None if they have not passed on anything. `rebuild()`
+        returns (embedding sum, passes) from history and is only called when the stored total
+        disagrees with num_seen (the user's swipe count).
+        """
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry[2] == num_seen:
+                self._users.move_to_end(user_id)
+                return dislike_vector(entry[0], entry[1])
+
+        total, passes = rebuild()
+        with self._lock:
+            self._users[user_id] = [np.array(total, dtype=np.float32), passes, num_seen]
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return dislike_vector(total, passes)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "bytes": sum(entry[0].nbytes for entry in self._users.values()),
+            }
@@ -0,0 +1,57 @@
+import numpy as np
+
+def mmr_rerank(embeddings, scores, k, lambda_=0.7, author_codes=None, max_per_author=None, window=None):
+    """
+    Maximal marginal relevance re-ranking.
+
+    Greedily picks k items maximizing lambda_ * score - (1 - lambda_) * max_sim, where max_sim is
+    the highest cosine similarity to anything already picked. max_sim is updated incrementally
+    with one (n, d) x (d,) product per pick, so the whole stage is O(n * k * d) numpy work.
+
+    embeddings: np.array (N, D), L2-normalized
+    scores: np.array (N,) relevance from RankerInference.predict_score
+    author_codes: optional np.array (N,) of ints; -1 means unknown (never capped)
+    max_per_author: optional cap on picks per author code within any `window` consecutive picks
+    window: page-sized window for the cap; None caps the whole list
+    Returns: np.array of positions into the inputs, in pick order. If author caps exclude
+    every remaining item, the best remaining one is picked anyway.
+    """
+    n = len(scores)
+    k = min(k, n)
+    relevance = lambda_ * np.asarray(scores, dtype=np.float32)
+    # Dissimilar items (negative cosine) are not rewarded, only similar ones penalized
+    max_sim = np.zeros(n, dtype=np.float32)
+    is_picked = np.zeros(n, dtype=bool)
+    picked = np.empty(k, dtype=np.int64)
+    capped = max_per_author is not None and author_codes is not None
+    # Items whose author has reached the cap in the current window
+    blocked = np.zeros(n, dtype=bool)
+    author_counts = {}
+
+    for count in range(k):
+        mmr = relevance - (1 - lambda_) * max_sim
+        mmr[is_picked] = -np.inf
+        j = int(np.argmax(np.where(blocked, -np.inf, mmr))) if capped else int(np.argmax(mmr))
+        if blocked[j] or is_picked[j]:
+            # Author caps ran out of candidates: take the best remaining item regardless
+            j = int(np.argmax(mmr))
+        picked[count] = j
+        is_picked[j] = True
+
+        if capped:
+            a = author_codes[j]
+            if a >= 0:
+                author_counts[a] = author_counts.get(a, 0) + 1
+                if author_counts[a] == max_per_author:
+                    blocked |= author_codes == a
+            if window is not None and count + 1 >= window:
+                # Slide the window: the pick that falls out of it no longer counts
+                old = author_codes[picked[count + 1 - window]]
+                if old >= 0:
+                    if author_counts[old] == max_per_author:
+                        blocked &= author_codes != old
+                    author_counts[old] -= 1
+
+        np.maximum(max_sim, embeddings @ embeddings[j], out=max_sim)
+
+    return picked
@@ -1,18 +1,63 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
 from typing import List, Optional
 import sqlite3
 import numpy as np
-import faiss
-import torch
 import os
 from fastapi.middleware.cors import CORSMiddleware
-from models.infer_ranker import RankerInference
+from app.rec_cache import RecommendationCache
+from app.recommender import Recommender, load_user_actions
+from app.worker import enqueue_profile_change, read_precomputed, backlog_stats
+from app.startup import StartupState
+from app.text_index import reciprocal_rank_fusion
+from app.bandit import BanditStore, thompson_quotas
+from app.dislike import DislikeStore
+from app.shards import ShardUnavailable
 import logging
 
 logging.basicConfig(filename='debug.log', level=logging.INFO, format='%(asctime)s %(message)s')
 
-app = FastAPI(title="BookSwipe API")
+# Genre exploration bandit (app/bandit.py): per-user Beta counters updated on every like/pass,
+# sampled on each ranking to set per-genre quotas. BANDIT_EXPLORATION=0 disables it.
+BANDIT_EXPLORATION = os.environ.get("BANDIT_EXPLORATION", "1") == "1"
+bandit_store = BanditStore()
+# Dislike profiles (app/dislike.py): running mean of passed-book embeddings per user, updated on
+# every pass and penalized by the ranker, so near-duplicates of rejected books sink.
+dislike_store = DislikeStore()
+
+# Artifacts Loading
+# Artifacts load in a background thread started by the lifespan handler, so the process is live
+# (and /health answers) within a second; /ready flips once the recommender is loaded.
+# Set SHARD_SOCKET_DIR to query shard servers (python -m app.shard_server --all) instead of a local index
+SHARD_SOCKET_DIR = os.environ.get("SHARD_SOCKET_DIR")
+# A failed load (e.g. shard servers not up yet) is retried with exponential backoff
+STARTUP_LOAD_ATTEMPTS = int(os.environ.get("STARTUP_LOAD_ATTEMPTS", "3"))
+STARTUP_RETRY_S = float(os.environ.get("STARTUP_RETRY_S", "5"))
+startup = StartupState(max_attempts=STARTUP_LOAD_ATTEMPTS, retry_delay=STARTUP_RETRY_S)
+startup.set_loader(lambda: Recommender(shard_socket_dir=SHARD_SOCKET_DIR, phase=startup.phase))
+
+def get_recommender():
+    # Never waits for the loader, so requests during startup answer 503 at once instead of
+    # holding threadpool threads (which /health also needs); None until artifacts are loaded
+    return startup.get(timeout=0)
+
+@asynccontextmanager
+async def lifespan(app):
+    startup.start_loading()
+    yield
+
+app = FastAPI(title="BookSwipe API", lifespan=lifespan)
+
+@app.exception_handler(ShardUnavailable)
+def shard_unavailable(request, exc):
+    # A shard server died or timed out: retryable, not a server bug
+    logging.error(f"Shard unavailable: {exc}")
+    return JSONResponse(status_code=503, content={"detail": "Search index temporarily unavailable"})
 
 # CORS
 app.add_middleware(
@@ -34,28 +79,16 @@ def get_db():
     finally:
         conn.close()
 
-# Artifacts Loading
-ARTIFACTS_DIR = "artifacts"
-try:
-    book_embeddings = np.load(os.path.join(ARTIFACTS_DIR, "book_embeddings.npy"))
-    book_ids = np.load(os.path.join(ARTIFACTS_DIR, "book_ids.npy"))
-    index = faiss.read_index(os.path.join(ARTIFACTS_DIR, "faiss.index"))
-    ranker = RankerInference()
-    
-    # Create a mapping from book_id to index in embeddings
-    book_id_to_idx = {bid: i for i, bid in enumerate(book_ids)}
-    
-    # Load metadata for quick access (in memory for prototype)
-    import pandas as pd
-    books_df = pd.read_csv("data/clean/books_clean.csv")
-    books_meta = books_df.set_index("book_id").to_dict(orient="index")
-    
-except Exception as e:
-    print(f"Error loading artifacts: {e}")
-    book_embeddings = None
-    index = None
-    ranker = None
-    books_meta = {}
+# Recommendation session cache
+# The first /recommend call ranks REC_CACHE_DEPTH items; later pages are read from that list
+# (skipping swiped books) until the user has liked REC_CACHE_REFRESH_LIKES more books.
+REC_CACHE_DEPTH = 200
+REC_CACHE_REFRESH_LIKES = 3
+REC_CACHE_MAX_MB = int(os.environ.get("REC_CACHE_MAX_MB", "64"))
+rec_cache = RecommendationCache(
+    max_bytes=REC_CACHE_MAX_MB * 1024 * 1024,
+    refresh_after_likes=REC_CACHE_REFRESH_LIKES,
+)
 
 # Models
 class UserAction(BaseModel):
@@ -75,19 +108,58 @@ class BookResponse(BaseModel):
 
 @app.get("/health")
 def health():
+    # Liveness: the process is up. Use /ready to know whether it can serve recommendations.
+    # Once every load attempt has failed nothing will recover without a restart, so fail here.
+    if startup.failed:
+        return JSONResponse(status_code=503, content={"status": "error", "error": startup.error})
     return {"status": "ok"}
 
+@app.get("/ready")
+def ready():
+    report = startup.report()
+    if not report["ready"]:
+        return JSONResponse(status_code=503, content={"status": "error" if report["failed"] else "loading", "startup": report})
+    return {"status": "ready", "startup": report}
+
 @app.post("/auth/demo-login")
 def demo_login():
     return {"user_id": "demo_user", "token": "demo_token"}
 
+def notify_profile_changed(db, user_id):
+    # Queue a re-rank for the background worker (python -m app.worker)
+    try:
+        enqueue_profile_change(db, user_id)
+    except sqlite3.OperationalError as e:
+        logging.warning(f"Could not enqueue profile change (run scripts/init_db.py?): {e}")
+
+def record_swipe(user_id, book_id, liked):
+    # O(1) bandit and dislike updates; skipped while artifacts are still loading (both rebuild from history)
+    if not startup.ready:
+        return
+    recommender = startup.get()
+    idx = recommender.book_id_to_idx.get(book_id)
+    if idx is not None:
+        bandit_store.record(user_id, int(recommender.book_arms[idx]), liked)
+        dislike_store.record(user_id, recommender.book_embeddings[idx], liked)
+
+def genre_quotas(recommender, user_id, liked_ids, seen_ids, size):
+    if not BANDIT_EXPLORATION:
+        return None
+    counts = bandit_store.counts(user_id, len(seen_ids), lambda: recommender.bandit_counts(liked_ids, seen_ids))
+    return thompson_quotas(counts, size)
+
+def dislike_profile(recommender, user_id, liked_ids, seen_ids):
+    return dislike_store.profile(user_id, len(seen_ids), lambda: recommender.pass_embedding_sum(liked_ids, seen_ids))
+
 @app.post("/user/{user_id}/like")
 def like_book(user_id: str, action: UserAction, db: sqlite3.Connection = Depends(get_db)):
     db.execute(
         "INSERT OR REPLACE INTO user_actions (user_id, book_id, action) VALUES (?, ?, 'like')",
         (user_id, action.book_id)
     )
+    notify_profile_changed(db, user_id)
     db.commit()
+    record_swipe(user_id, action.book_id, liked=True)
     return {"status": "liked"}
 
 @app.post("/user/{user_id}/pass")
@@ -96,7 +168,9 @@ def pass_book(user_id: str, action: UserAction, db: sqlite3.Connection = Depends
         "INSERT OR REPLACE INTO user_actions (user_id, book_id, action) VALUES (?, ?, 'pass')",
         (user_id, action.book_id)
     )
+    notify_profile_changed(db, user_id)
     db.commit()
+    record_swipe(user_id, action.book_id, liked=False)
     return {"status": "passed"}
 
 @app.get("/user/{user_id}/history")
@@ -105,10 +179,51 @@ def get_history(user_id: str, db: sqlite3.Connection = Depends(get_db)):
     rows = cursor.fetchall()
     return [{"book_id": r["book_id"], "action": r["action"]} for r in rows]
 
+@app.get("/metrics")
+def metrics(db: sqlite3.Connection = Depends(get_db)):
+    try:
+        worker_backlog = backlog_stats(db)
+    except sqlite3.OperationalError:
+        worker_backlog = None
+    return {
+        "recommend_cache": rec_cache.stats(),
+        "worker_backlog": worker_backlog,
+        "bandit": bandit_store.stats(),
+        "dislike_profiles": dislike_store.stats(),
+        "startup": startup.report(),
+    }
+
+def load_precomputed_ranking(recommender, db, user_id, profile_version, seen_ids):
+    """
+    Ranked list written by the background worker, if it is recent enough for this profile.
+    Returns (indices, scores, stored_version) with seen books removed, or None.
+    """
+    try:
+        stored = read_precomputed(db, user_id)
+    except sqlite3.OperationalError:
+        return None
+    if stored is None:
+        return None
+    stored_version, bids, scores = stored
+    if stored_version > profile_version or profile_version - stored_version >= REC_CACHE_REFRESH_LIKES:
+        return None
+    # Drop books swiped since the worker ran (and any no longer in the catalog)
+    kept = [(recommender.book_id_to_idx[b], score) for b, score in zip(bids.tolist(), scores.tolist())
+            if b not in seen_ids and b in recommender.book_id_to_idx]
+    if not kept:
+        return None
+    indices, kept_scores = zip(*kept)
+    return np.asarray(indices, dtype=np.int64), np.asarray(kept_scores, dtype=np.float32), stored_version
+
 @app.get("/recommend", response_model=List[BookResponse])
-def recommend(user_id: str, n: int = 10, genres: Optional[str] = None, db: sqlite3.Connection = Depends(get_db)):
+def recommend(user_id: str, n: int = 10, offset: int = Query(0, ge=0), genres: Optional[str] = None,
+              db: sqlite3.Connection = Depends(get_db)):
+    # Best n books the user has not swiped yet, skipping the first `offset` of them. Swiped books
+    # drop out of the list, so a deck can keep asking for offset=0; offset looks further ahead
+    # without swiping. Calls without a swipe in between return the same books.
     logging.info(f"Recommend called for user {user_id} with genres: {genres}")
-    if index is None:
+    recommender = get_recommender()
+    if recommender is None:
         logging.error("Index is None")
         raise HTTPException(status_code=503, detail="Search index not ready")
 
@@ -118,102 +233,51 @@ def recommend(user_id: str, n: int = 10, genres: Optional[str] = None, db: sqlit
         requested_genres = [g.strip().lower() for g in genres.split(',')]
 
     # 1. Get user history
-    cursor = db.execute("SELECT book_id FROM user_actions WHERE user_id = ? AND action = 'like'", (user_id,))
-    liked_ids = [r["book_id"] for r in cursor.fetchall()]
-    
-    # 2. Compute user profile
-    user_emb = None
-    if liked_ids:
-        # Get embeddings for liked books
-        liked_indices = [book_id_to_idx[bid] for bid in liked_ids if bid in book_id_to_idx]
-        if liked_indices:
-            user_emb = np.mean(book_embeddings[liked_indices], axis=0).reshape(1, -1)
-            faiss.normalize_L2(user_emb)
-    
-    # If no user embedding (cold start), use a generic query or random
-    if user_emb is None:
-        # Create a random vector or use average of all books as a starting point
-        # For now, let's pick a random book's embedding to simulate "exploration"
-        import random
-        rand_idx = random.randint(0, len(book_embeddings) - 1)
-        user_emb = book_embeddings[rand_idx].reshape(1, -1)
-    
-    # 3. Retrieval
-    # We retrieve more candidates to allow for filtering
-    k = 2000 
-    D, I = index.search(user_emb, k)
-    candidate_indices = I[0]
-    
-    # Filter out already seen AND filter by genre
-    cursor = db.execute("SELECT book_id FROM user_actions WHERE user_id = ?", (user_id,))
-    seen_ids = set(r["book_id"] for r in cursor.fetchall())
-    
-    filtered_indices = []
-    for idx in candidate_indices:
-        if idx == -1: continue
-        bid = book_ids[idx]
-        
-        if bid in seen_ids:
-            continue
-            
-        # Genre Filtering
-        if requested_genres:
-            book_meta = books_meta.get(bid)
-            if not book_meta: continue
-            
-            book_genres = str(book_meta.get('genres', '')).lower()
-            match = False
-            for rg in requested_genres:
-                if rg in book_genres:
-                    match = True
-                    break
-            if not match:
-                continue
-                
-        filtered_indices.append(idx)
-            
-    if not filtered_indices and requested_genres:
-        # Fallback: If vector search found nothing in this genre (e.g. user likes Romance but asked for Sci-Fi),
-        # we manually search the database for books of this genre.
-        logging.info("Vector search yielded 0 results for genre. Using fallback.")
-        all_items = list(books_meta.items())
-        import random
-        random.shuffle(all_items)
-        
-        for bid, meta in all_items:
-            if len(filtered_indices) >= n: break
-            if bid in seen_ids: continue
-            
-            book_genres = str(meta.get('genres', '')).lower()
-            match = False
-            for rg in requested_genres:
-                if rg in book_genres:
-                    match = True
-                    break
-            
-            if match:
-                # Find the index for this book_id to get its embedding later
-                if bid in book_id_to_idx:
-                    filtered_indices.append(book_id_to_idx[bid])
-
-    if not filtered_indices:
-        # Final Fallback: just show something random if everything else failed
-        pass
-        
-    # 4. Ranking
-    if not filtered_indices:
-         return []
-
-    candidate_embs = book_embeddings[filtered_indices]
-    scores = ranker.predict_score(user_emb[0], candidate_embs)
-    
-    # Sort by score
-    ranked_results = sorted(zip(filtered_indices, scores), key=lambda x: x[1], reverse=True)[:n]
-    
+    liked_ids, seen_ids = load_user_actions(db, user_id)
+    # The like count is the profile version: cached rankings REC_CACHE_REFRESH_LIKES likes old are
+    # re-ranked before they are served
+    profile_version = len(liked_ids)
+    cache_key = (user_id, tuple(sorted(requested_genres)))
+
+    def rescore_cached(user_emb, indices):
+        # New swipes since the list was scored: re-order the unswiped remainder with the current
+        # bandit quotas and dislike profile. Only the cached candidates are scored, no retrieval.
+        quotas = None if requested_genres else genre_quotas(recommender, user_id, liked_ids, seen_ids, len(indices))
+        dislike_emb = dislike_profile(recommender, user_id, liked_ids, seen_ids)
+        indices, scores = recommender.rescore(user_emb, indices, len(indices), quotas, dislike_emb)
+        return indices, recommender.book_ids[indices], scores
+
+    # Swipes re-score the cached list; only likes (profile_version) trigger a full re-rank
+    swipes = len(seen_ids)
+    cached = rec_cache.take(cache_key, profile_version, offset, n, seen_ids, swipes, rescore_cached)
+    if cached is not None:
+        page_indices, page_scores = cached
+    else:
+        precomputed = None
+        if not requested_genres:
+            precomputed = load_precomputed_ranking(recommender, db, user_id, profile_version, seen_ids)
+        # Version the cached list by the profile it was ranked from, so a stale one refreshes on time
+        ranked_version = profile_version
+        # 2. Compute user profile
+        user_emb = recommender.user_profile(liked_ids)
+        if precomputed is not None and len(precomputed[0]) >= offset + n:
+            indices, _, ranked_version = precomputed
+            # The worker may have run before the latest passes
+            indices, _, scores = rescore_cached(user_emb, indices)
+        else:
+            # 3. Retrieval + 4. Ranking, deep enough to serve the next pages from cache
+            # Explicit genre filters override the bandit's genre mix
+            depth = max(offset + n, REC_CACHE_DEPTH)
+            quotas = None if requested_genres else genre_quotas(recommender, user_id, liked_ids, seen_ids, depth)
+            dislike_emb = dislike_profile(recommender, user_id, liked_ids, seen_ids)
+            indices, scores = recommender.rank(user_emb, seen_ids, requested_genres, depth, quotas, dislike_emb)
+        page_indices, page_scores = indices[offset:offset + n], scores[offset:offset + n]
+        rec_cache.put(cache_key, indices, recommender.book_ids[indices], scores, ranked_version, swipes, user_emb)
+
     results = []
-    for idx, score in ranked_results:
-        bid = book_ids[idx]
-        meta = books_meta.get(bid)
+    for idx, score in zip(page_indices, page_scores):
+        bid = recommender.book_ids[idx]
+        meta = recommender.books_meta.get(bid)
         if meta:
             # Ensure book_id is in response and cast types
             meta_with_id = meta.copy()
@@ -223,9 +287,71 @@ def recommend(user_id: str, n: int = 10, genres: Optional[str] = None, db: sqlit
             
     return results
 
+# Hybrid search: BM25 over title/author/tags fused with an embedding re-ranking of the BM25
+# candidates by reciprocal rank fusion
+SEARCH_DEPTH = 100
+# BM25 candidates the vector side re-orders; its cost is SEARCH_CANDIDATES x dim, not catalog x dim
+SEARCH_CANDIDATES = 1000
+
+@app.get("/search", response_model=List[BookResponse])
+def search(q: str, n: int = 10, user_id: Optional[str] = None):
+    recommender = get_recommender()
+    if recommender is None or recommender.text_index is None:
+        raise HTTPException(status_code=503, detail="Search index not ready")
+
+    # 1. Lexical. Nothing matching the query means nothing to return.
+    rows, _ = recommender.text_index.search(q, SEARCH_CANDIDATES)
+    candidate_ids = recommender.text_index.book_ids[rows].tolist()
+    if not candidate_ids:
+        return []
+    lexical_ids = candidate_ids[:SEARCH_DEPTH]
+
+    # 2. Vector: the BM25 candidates closest to the best lexical hits, so weaker keyword matches
+    # that are about the same thing move up. Only the candidates' embeddings are scored (no k-NN
+    # over the catalog), and no sentence-transformer is loaded into the API to embed the query.
+    seed_ids = [b for b in lexical_ids[:3] if b in recommender.book_id_to_idx]
+    vector_ids = []
+    if seed_ids:
+        query_emb = recommender.user_profile(seed_ids)[0]
+        found = [bid for bid in candidate_ids if bid in recommender.book_id_to_idx]
+        rows = np.array([recommender.book_id_to_idx[b] for b in found], dtype=np.int64)
+        similarity = np.asarray(recommender.book_embeddings[rows] @ query_emb)
+        vector_ids = [found[i] for i in np.argsort(-similarity, kind="stable")[:SEARCH_DEPTH]]
+
+    # 3. Fuse
+    rankings = [lexical_ids, vector_ids]
+    fused = reciprocal_rank_fusion(rankings)
+    if user_id:
+        # Personalise by boosting the lexical matches closest to the user's taste, so likes
+        # re-order what the query found and never add unrelated books
+        # Only personalised searches touch the database
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            liked_ids, _ = load_user_actions(conn, user_id)
+        finally:
+            conn.close()
+        if any(b in recommender.book_id_to_idx for b in liked_ids):
+            user_emb = recommender.user_profile(liked_ids)[0]
+            found = [bid for bid in lexical_ids if bid in recommender.book_id_to_idx]
+            rows = np.array([recommender.book_id_to_idx[b] for b in found], dtype=np.int64)
+            affinity = np.asarray(recommender.book_embeddings[rows] @ user_emb)
+            rankings.append([found[i] for i in np.argsort(-affinity, kind="stable")])
+            fused = reciprocal_rank_fusion(rankings)
+
+    results = []
+    for bid, score in fused:
+        if len(results) >= n: break
+        meta = recommender.books_meta.get(bid)
+        if meta:
+            meta_with_id = meta.copy()
+            meta_with_id['book_id'] = int(bid)
+            meta_with_id['score'] = float(score)
+            results.append(BookResponse(**meta_with_id))
+    return results
+
+startup.phases["import"] = round(time.perf_counter() - _IMPORT_STARTED, 4)
+
 # Fix for book_id in meta
-# When loading:
-# books_df = pd.read_csv("data/clean/books_clean.csv")
-# books_meta = books_df.set_index("book_id").to_dict(orient="index")
-# The values in books_meta won't have 'book_id'.
+# When loading (app/recommender.py load_books_meta), books_meta is keyed by book_id,
+# so the values won't have 'book_id'.
 # I handle this in the recommend function by adding it back.
@@ -0,0 +1,109 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class CachedRanking:
+    """A deep ranked list for one (user, genres) key, served page by page."""
+
+    __slots__ = ("indices", "book_ids", "scores", "profile_version", "swipes", "user_emb")
+
+    def __init__(self, indices, book_ids, scores, profile_version, swipes=None, user_emb=None):
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.book_ids = np.asarray(book_ids, dtype=np.int64)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.profile_version = profile_version
+        # Swipe count the scores reflect (None: unknown, re-score on first read)
+        self.swipes = swipes
+        # Profile the list was ranked for, kept so it can be re-scored without re-ranking
+        self.user_emb = user_emb
+
+    @property
+    def nbytes(self):
+        # Arrays dominate; add a flat allowance for the object, key and dict slot
+        extra = self.user_emb.nbytes if self.user_emb is not None else 0
+        return self.indices.nbytes + self.book_ids.nbytes + self.scores.nbytes + extra + 256
+
+
+class RecommendationCache:
+    """
+    Per-user cache of ranked recommendation lists.
+
+    The first /recommend call for a user ranks a deep list (e.g. 200 items) and stores it here
+    together with the profile version it was computed from (the number of likes). Following
+    calls page through the items the user has not swiped yet instead of re-running
+    retrieve -> filter -> rank. Reads have no side effects: the same (offset, n) returns the same
+    books until the user swipes. After new swipes the unswiped remainder can be re-scored in
+    place (e.g. against an updated dislike profile), which only touches the cached candidates.
+    Once the user has liked refresh_after_likes more books the entry is stale and the caller
+    ranks a fresh list.
+    Entries are evicted least-recently-used once the total size exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, refresh_after_likes=3):
+        self.max_bytes = max_bytes
+        self.refresh_after_likes = refresh_after_likes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def put(self, key, indices, book_ids, scores, profile_version, swipes=None, user_emb=None):
+        entry = CachedRanking(indices, book_ids, scores, profile_version, swipes, user_emb)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+        return entry
+
+    def take(self, key, profile_version, offset, n, seen_ids, swipes=None, rescore=None):
+        """
+        Items offset .. offset + n of the unseen part of key's list.
+        rescore(user_emb, indices) -> (indices, book_ids, scores) re-orders the unseen remainder
+        when the entry's swipe count differs from `swipes`; it runs outside the lock and the
+        result replaces the entry.
+        Returns (indices, scores), or None on a miss: a missing entry, one ranked from a newer
+        profile than the caller's, one refresh_after_likes or more likes old, or one with fewer
+        than offset + n unseen items.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not 0 <= profile_version - entry.profile_version < self.refresh_after_likes:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+
+        unseen = np.fromiter((b not in seen_ids for b in entry.book_ids.tolist()), dtype=bool, count=len(entry.book_ids))
+        positions = np.flatnonzero(unseen)
+        if rescore is not None and entry.swipes != swipes and len(positions):
+            indices, book_ids, scores = rescore(entry.user_emb, entry.indices[positions])
+            entry = self.put(key, indices, book_ids, scores, entry.profile_version, swipes, entry.user_emb)
+            positions = np.arange(len(entry.indices))
+        positions = positions[offset:offset + n]
+        with self._lock:
+            if len(positions) < n:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return entry.indices[positions], entry.scores[positions]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,261 @@
+import os
+import csv
+import random
+import logging
+from contextlib import nullcontext
+import numpy as np
+from models.infer_ranker import RankerInference
+from app.diversity import mmr_rerank
+from app.bandit import fill_quotas, counts_from_history
+
+ARTIFACTS_DIR = "artifacts"
+BOOKS_PATH = "data/clean/books_clean.csv"
+
+# Diversity re-ranking (MMR) over the best DIVERSITY_POOL scored candidates.
+# DIVERSITY_LAMBDA=1.0 ranks purely by score; lower values trade relevance for variety.
+DIVERSITY_LAMBDA = float(os.environ.get("DIVERSITY_LAMBDA", "0.7"))
+DIVERSITY_POOL = 500
+# At most MAX_PER_AUTHOR books by one author in any AUTHOR_WINDOW consecutive items (one deck page),
+# so an author the user keeps liking comes back on the next page
+MAX_PER_AUTHOR = 3
+AUTHOR_WINDOW = 10
+
+# Genre exploration (app/bandit.py): genres whose quota the user's neighbourhood cannot fill get
+# an extra query, for at most EXPLORE_ARMS genres per ranking.
+EXPLORE_ARMS = 4
+EXPLORE_K = 200
+
+def load_user_actions(db, user_id):
+    # One query for both the like profile and the seen filter
+    cursor = db.execute("SELECT book_id, action FROM user_actions WHERE user_id = ?", (user_id,))
+    rows = cursor.fetchall()
+    liked_ids = [r[0] for r in rows if r[1] == 'like']
+    seen_ids = set(r[0] for r in rows)
+    return liked_ids, seen_ids
+
+def load_books_meta(books_path):
+    # Plain csv keeps pandas off the serving path; only the fields the API returns are kept
+    books_meta = {}
+    with open(books_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            books_meta[int(row['book_id'])] = {
+                'title': row['title'],
+                'author': row['author'],
+                'description': row['description'],
+                'genres': row['genres'],
+                'avg_rating': float(row['avg_rating'] or 0.0),
+                'num_ratings': int(float(row['num_ratings'] or 0)),
+                'tags': row['tags'],
+            }
+    return books_meta
+
+def normalize_rows(x):
+    # Same as faiss.normalize_L2, without importing faiss
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1e-9
+    x /= norms
+    return x
+
+def primary_genre(meta):
+    # books_clean.csv has one genre per book; synthetic data joins several with '|'
+    return str(meta.get('genres', '')).split('|')[0].strip()
+
+def matches_genres(meta, requested_genres):
+    book_genres = str(meta.get('genres', '')).lower()
+    for rg in requested_genres:
+        if rg in book_genres:
+            return True
+    return False
+
+class Recommender:
+    """
+    The retrieve -> filter -> rank pipeline and the artifacts it needs.
+    Shared by the API process and the background re-ranking workers (app/worker.py).
+    """
+
+    def __init__(self, artifacts_dir=ARTIFACTS_DIR, books_path=BOOKS_PATH, shard_socket_dir=None, phase=None):
+        # phase(name) -> context manager timing each loading step (see app/startup.py)
+        phase = phase or (lambda name: nullcontext())
+        # Retrieval/re-ranking knobs; scripts/evaluate.py varies them per config
+        self.retrieval_k = 2000
+        self.diversity_lambda = DIVERSITY_LAMBDA
+
+        with phase("embeddings"):
+            self.book_ids = np.load(os.path.join(artifacts_dir, "book_ids.npy"))
+            if shard_socket_dir:
+                # Sharded mode: embeddings are memory-mapped so every API process shares one
+                # page-cached copy instead of holding its own.
+                self.book_embeddings = np.load(os.path.join(artifacts_dir, "book_embeddings.npy"), mmap_mode="r")
+            else:
+                self.book_embeddings = np.load(os.path.join(artifacts_dir, "book_embeddings.npy"))
+
+        with phase("index"):
+            if shard_socket_dir:
+                # k-NN is answered by shard servers (app/shard_server.py)
+                from app.shards import ShardedIndex
+                self.index = ShardedIndex.from_dir(shard_socket_dir, os.path.join(artifacts_dir, "shards"), len(self.book_ids))
+            else:
+                import faiss
+                self.index = faiss.read_index(os.path.join(artifacts_dir, "faiss.index"))
+
+        with phase("text_index"):
+            # Optional: /search is unavailable until scripts/build_index.py has built it
+            text_index_path = os.path.join(artifacts_dir, "text_index.npz")
+            self.text_index = None
+            if os.path.exists(text_index_path):
+                from app.text_index import TextIndex
+                self.text_index = TextIndex.load(text_index_path)
+
+        with phase("ranker"):
+            self.ranker = RankerInference()
+
+        with phase("metadata"):
+            # Create a mapping from book_id to index in embeddings
+            self.book_id_to_idx = {bid: i for i, bid in enumerate(self.book_ids.tolist())}
+            self.books_meta = load_books_meta(books_path)
+            # Integer author code per embedding row, for the per-author cap in diversity re-ranking,
+            # and genre arm per row for the exploration bandit
+            author_to_code = {}
+            arm_to_code = {}
+            self.author_codes = np.full(len(self.book_ids), -1, dtype=np.int64)
+            self.book_arms = np.full(len(self.book_ids), -1, dtype=np.int64)
+            for i, bid in enumerate(self.book_ids.tolist()):
+                meta = self.books_meta.get(bid)
+                if meta:
+                    self.author_codes[i] = author_to_code.setdefault(meta['author'], len(author_to_code))
+                    self.book_arms[i] = arm_to_code.setdefault(primary_genre(meta), len(arm_to_code))
+            self.arm_names = list(arm_to_code)
+            # Embedding rows per arm, to seed exploration queries
+            by_arm = np.argsort(self.book_arms, kind="stable")
+            bounds = np.searchsorted(self.book_arms[by_arm], np.arange(len(self.arm_names) + 1))
+            self.arm_rows = [by_arm[bounds[a]:bounds[a + 1]] for a in range(len(self.arm_names))]
+
+    def user_profile(self, liked_ids):
+        user_emb = None
+        if liked_ids:
+            # Get embeddings for liked books
+            liked_indices = [self.book_id_to_idx[bid] for bid in liked_ids if bid in self.book_id_to_idx]
+            if liked_indices:
+                user_emb = np.mean(self.book_embeddings[liked_indices], axis=0).reshape(1, -1)
+                normalize_rows(user_emb)
+
+        # If no user embedding (cold start), use a generic query or random
+        if user_emb is None:
+            # Create a random vector or use average of all books as a starting point
+            # For now, let's pick a random book's embedding to simulate "exploration"
+            rand_idx = random.randint(0, len(self.book_embeddings) - 1)
+            user_emb = np.array(self.book_embeddings[rand_idx], dtype=np.float32).reshape(1, -1)
+        return user_emb
+
+    def pass_embedding_sum(self, liked_ids, seen_ids):
+        """(sum of passed-book embeddings, number of passes), to seed a DislikeStore entry."""
+        liked = set(liked_ids)
+        rows = sorted(self.book_id_to_idx[b] for b in seen_ids if b not in liked and b in self.book_id_to_idx)
+        total = np.zeros(self.book_embeddings.shape[1], dtype=np.float32)
+        if rows:
+            total = np.asarray(self.book_embeddings[rows], dtype=np.float32).sum(axis=0)
+        return total, len(rows)
+
+    def bandit_counts(self, liked_ids, seen_ids):
+        return counts_from_history(self.book_arms, self.book_id_to_idx, len(self.arm_names), liked_ids, seen_ids)
+
+    def explore_candidates(self, user_emb, candidate_indices, quotas):
+        """
+        Add candidates for the genres whose bandit quota the user's own neighbourhood cannot fill.
+        One batched search, with each query halfway between the user and a random book of that genre.
+        """
+        valid = candidate_indices[candidate_indices >= 0]
+        arms = self.book_arms[valid]
+        have = np.bincount(arms[arms >= 0], minlength=len(quotas))
+        deficit = quotas - have
+        explore = [a for a in np.argsort(-deficit, kind="stable")[:EXPLORE_ARMS]
+                   if deficit[a] > 0 and len(self.arm_rows[a])]
+        if not explore:
+            return candidate_indices
+
+        seeds = [self.arm_rows[a][random.randrange(len(self.arm_rows[a]))] for a in explore]
+        queries = normalize_rows(np.asarray(user_emb + self.book_embeddings[seeds], dtype=np.float32))
+        D, I = self.index.search(queries, EXPLORE_K)
+        extra = [row[(row >= 0) & (self.book_arms[row] == a)] for row, a in zip(I, explore)]
+
+        merged = np.concatenate([candidate_indices] + extra)
+        # Drop duplicates, keeping first occurrence order
+        _, first = np.unique(merged, return_index=True)
+        return merged[np.sort(first)]
+
+    def rank(self, user_emb, seen_ids, requested_genres, depth, quotas=None, dislike_emb=None):
+        """
+        Retrieve -> filter -> rank -> diversify for one user.
+        quotas: optional per-genre slot counts from the exploration bandit (app/bandit.py).
+        dislike_emb: optional mean embedding of passed books (app/dislike.py), penalized when scoring.
+        Returns (indices, scores) in display order, at most `depth` long.
+        """
+        # We retrieve more candidates to allow for filtering
+        D, I = self.index.search(user_emb, self.retrieval_k)
+        candidate_indices = I[0]
+        if quotas is not None:
+            candidate_indices = self.explore_candidates(user_emb, candidate_indices, quotas)
+
+        filtered_indices = []
+        for idx in candidate_indices:
+            if idx == -1: continue
+            bid = self.book_ids[idx]
+
+            if bid in seen_ids:
+                continue
+
+            # Genre Filtering
+            if requested_genres:
+                book_meta = self.books_meta.get(bid)
+                if not book_meta: continue
+                if not matches_genres(book_meta, requested_genres):
+                    continue
+
+            filtered_indices.append(idx)
+
+        if not filtered_indices and requested_genres:
+            # Fallback: If vector search found nothing in this genre (e.g. user likes Romance but asked for Sci-Fi),
+            # we manually search the database for books of this genre.
+            logging.info("Vector search yielded 0 results for genre. Using fallback.")
+            all_items = list(self.books_meta.items())
+            random.shuffle(all_items)
+
+            for bid, meta in all_items:
+                if len(filtered_indices) >= depth: break
+                if bid in seen_ids: continue
+
+                if matches_genres(meta, requested_genres):
+                    # Find the index for this book_id to get its embedding later
+                    if bid in self.book_id_to_idx:
+                        filtered_indices.append(self.book_id_to_idx[bid])
+
+        if not filtered_indices:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        return self.rescore(user_emb, np.asarray(filtered_indices, dtype=np.int64), depth, quotas, dislike_emb)
+
+    def rescore(self, user_emb, indices, depth, quotas=None, dislike_emb=None):
+        """
+        Rank -> diversify an already filtered candidate list. rank() ends here, and /recommend calls
+        it directly to re-order a cached list after new passes without another retrieval.
+        Returns (indices, scores) in display order, at most `depth` long.
+        """
+        candidate_embs = self.book_embeddings[indices]
+        scores = self.ranker.predict_score(user_emb[0], candidate_embs, dislike_emb)
+
+        # Sort by score (stable, so ties keep retrieval order)
+        order = np.argsort(-scores, kind="stable")
+        if quotas is not None:
+            # The bandit decides how many slots each genre gets; scores decide which books fill them
+            order = order[fill_quotas(self.book_arms[indices[order]], quotas, depth)]
+        order = order[:max(depth, DIVERSITY_POOL)]
+        if self.diversity_lambda < 1.0:
+            # Re-rank the top of the list so near-duplicates (same author/series) are spread out
+            picked = mmr_rerank(
+                candidate_embs[order], scores[order], depth, self.diversity_lambda,
+                self.author_codes[indices[order]], MAX_PER_AUTHOR, AUTHOR_WINDOW,
+            )
+            order = order[picked]
+        order = order[:depth]
+        return indices[order], scores[order]
+
@@ -0,0 +1,86 @@
+"""
+Shard server: holds one retrieval shard in memory and answers k-NN queries over a unix socket.
+
+Serve a single shard:
+    python -m app.shard_server --shard 0
+Or start one process per shard found in artifacts/shards/:
+    python -m app.shard_server --all
+
+Then run the API with SHARD_SOCKET_DIR set (default socket dir: /tmp/bookswipe-shards).
+Both sides need the same SHARD_AUTHKEY.
+"""
+import argparse
+import logging
+import os
+import threading
+from multiprocessing import AuthenticationError, Process
+from multiprocessing.connection import Listener
+import faiss
+from app.shards import (
+    SHARDS_DIR, DEFAULT_SOCKET_DIR, shard_index_path, shard_socket_path, count_shards, shard_authkey, ensure_socket_dir,
+)
+
+def _handle(conn, index):
+    with conn:
+        while True:
+            try:
+                queries, k = conn.recv()
+            except EOFError:
+                return
+            conn.send(index.search(queries, k))
+
+def serve_shard(shard, shards_dir=SHARDS_DIR, socket_dir=DEFAULT_SOCKET_DIR, authkey=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    authkey = shard_authkey(authkey)
+    # One search thread per process: parallelism comes from running one process per shard
+    faiss.omp_set_num_threads(1)
+    index = faiss.read_index(shard_index_path(shards_dir, shard))
+
+    ensure_socket_dir(socket_dir, create=True)
+    address = shard_socket_path(socket_dir, shard)
+    if os.path.exists(address):
+        os.remove(address)
+
+    # Clients that fail the authkey handshake are rejected before anything is unpickled
+    with Listener(address, family="AF_UNIX", authkey=authkey) as listener:
+        logging.info(f"Shard {shard} serving {index.ntotal} vectors on {address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, OSError, EOFError) as e:
+                logging.warning(f"Shard {shard} rejected a connection: {e!r}")
+                continue
+            # faiss releases the GIL during search, so concurrent API connections overlap
+            threading.Thread(target=_handle, args=(conn, index), daemon=True).start()
+
+def serve_all(shards_dir=SHARDS_DIR, socket_dir=DEFAULT_SOCKET_DIR, authkey=None):
+    authkey = shard_authkey(authkey)
+    num_shards = count_shards(shards_dir)
+    if num_shards == 0:
+        print(f"Error: no shards in {shards_dir}. Run scripts/build_index.py --shards N first.")
+        return
+    procs = [Process(target=serve_shard, args=(i, shards_dir, socket_dir, authkey), daemon=True) for i in range(num_shards)]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve retrieval shards over unix sockets.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--shard", type=int, help="Serve a single shard")
+    group.add_argument("--all", action="store_true", help="Start one process per shard")
+    parser.add_argument("--shards-dir", default=SHARDS_DIR)
+    parser.add_argument("--socket-dir", default=os.environ.get("SHARD_SOCKET_DIR", DEFAULT_SOCKET_DIR))
+    args = parser.parse_args()
+
+    if args.all:
+        serve_all(args.shards_dir, args.socket_dir)
+    else:
+        serve_shard(args.shard, args.shards_dir, args.socket_dir)
+
+if __name__ == "__main__":
+    main()
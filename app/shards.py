@@ -0,0 +1,155 @@
+"""
+Sharded retrieval.
+
+scripts/build_index.py --shards N partitions the catalog into N faiss indexes under
+artifacts/shards/. Each shard is served by its own process (app/shard_server.py) over a unix
+socket, so no single process has to hold the whole index. ShardedIndex fans a query out to
+every shard in parallel and merges the per-shard top-k, exposing the same search() signature
+as a faiss index.
+
+multiprocessing.connection pickles messages, so both sides authenticate with SHARD_AUTHKEY and
+the socket directory must be private to the user running them (mode 0700).
+"""
+import glob
+import os
+import queue
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+import numpy as np
+
+SHARDS_DIR = os.path.join("artifacts", "shards")
+DEFAULT_SOCKET_DIR = "/tmp/bookswipe-shards"
+# Seconds to wait for one shard's answer before the request fails with 503
+SHARD_TIMEOUT = float(os.environ.get("SHARD_TIMEOUT", "2.0"))
+# Seconds the API waits at startup for all shard servers to accept connections
+SHARD_CONNECT_TIMEOUT = float(os.environ.get("SHARD_CONNECT_TIMEOUT", "30"))
+
+class ShardUnavailable(Exception):
+    """A shard server could not be reached or did not answer in time."""
+
+def shard_authkey(authkey=None):
+    authkey = authkey or os.environ.get("SHARD_AUTHKEY")
+    if not authkey:
+        raise RuntimeError("Set SHARD_AUTHKEY (same value for the API and app.shard_server).")
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+def ensure_socket_dir(socket_dir, create=False):
+    """
+    Refuse a socket directory that another user could have planted or can write to: it must be
+    a real directory owned by us. Ours but too open is tightened to 0700.
+    """
+    if create:
+        os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+    st = os.lstat(socket_dir)
+    if not stat.S_ISDIR(st.st_mode):
+        raise PermissionError(f"Shard socket dir {socket_dir} is not a directory")
+    if st.st_uid != os.getuid():
+        raise PermissionError(f"Shard socket dir {socket_dir} is owned by another user")
+    if st.st_mode & 0o077:
+        os.chmod(socket_dir, 0o700)
+
+def shard_index_path(shards_dir, shard):
+    return os.path.join(shards_dir, f"shard_{shard}.index")
+
+def shard_socket_path(socket_dir, shard):
+    return os.path.join(socket_dir, f"shard-{shard}.sock")
+
+def count_shards(shards_dir=SHARDS_DIR):
+    return len(glob.glob(os.path.join(shards_dir, "shard_*.index")))
+
+def merge_topk(distances, labels, k):
+    """
+    Merge per-shard results, each (nq, k_shard), into the global top-k by inner product.
+    distances/labels: lists with one array per shard.
+    """
+    D = np.concatenate(distances, axis=1)
+    I = np.concatenate(labels, axis=1)
+    # faiss pads missing results with label -1
+    D = np.where(I == -1, -np.inf, D)
+    k = min(k, D.shape[1])
+    top = np.argpartition(-D, k - 1, axis=1)[:, :k]
+    top_d = np.take_along_axis(D, top, axis=1)
+    order = np.argsort(-top_d, axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+    return np.take_along_axis(D, top, axis=1), np.take_along_axis(I, top, axis=1)
+
+class _ShardClient:
+    # Connections are not thread-safe, so each shard keeps a small pool of them
+    def __init__(self, address, authkey, timeout=SHARD_TIMEOUT):
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._pool = queue.LifoQueue()
+
+    def connect(self):
+        try:
+            return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+        except (OSError, EOFError, AuthenticationError) as e:
+            raise ShardUnavailable(f"Cannot connect to shard at {self.address}: {e!r}") from e
+
+    def warm(self):
+        # Connect (and authenticate) now, keeping the connection for the first search
+        self._pool.put(self.connect())
+
+    def search(self, queries, k):
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self.connect()
+        try:
+            conn.send((queries, k))
+            if not conn.poll(self.timeout):
+                raise ShardUnavailable(f"Shard at {self.address} did not answer within {self.timeout}s")
+            result = conn.recv()
+        except ShardUnavailable:
+            conn.close()
+            raise
+        except (OSError, EOFError) as e:
+            # Server restarted or died: drop the connection, the next call reconnects
+            conn.close()
+            raise ShardUnavailable(f"Shard at {self.address} failed: {e!r}") from e
+        self._pool.put(conn)
+        return result
+
+class ShardedIndex:
+    def __init__(self, socket_paths, ntotal=None, authkey=None, timeout=SHARD_TIMEOUT):
+        authkey = shard_authkey(authkey)
+        self.shards = [_ShardClient(p, authkey, timeout) for p in socket_paths]
+        self.ntotal = ntotal
+        self._executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="shard")
+
+    @classmethod
+    def from_dir(cls, socket_dir=DEFAULT_SOCKET_DIR, shards_dir=SHARDS_DIR, ntotal=None, authkey=None,
+                 connect_timeout=SHARD_CONNECT_TIMEOUT):
+        num_shards = count_shards(shards_dir)
+        if num_shards == 0:
+            raise FileNotFoundError(f"No shards found in {shards_dir}. Run scripts/build_index.py --shards N.")
+        index = cls([shard_socket_path(socket_dir, i) for i in range(num_shards)], ntotal, authkey)
+        # Readiness means every shard answers, not just that the files exist
+        index.wait_until_connected(socket_dir, connect_timeout)
+        return index
+
+    def wait_until_connected(self, socket_dir, timeout):
+        """Open one connection per shard, retrying until `timeout` while shard servers start."""
+        deadline = time.time() + timeout
+        pending = list(self.shards)
+        while True:
+            try:
+                ensure_socket_dir(socket_dir)
+                while pending:
+                    pending[0].warm()
+                    pending.pop(0)
+                return
+            except (ShardUnavailable, FileNotFoundError) as e:
+                if time.time() >= deadline:
+                    raise ShardUnavailable(f"{len(pending)} of {len(self.shards)} shards unavailable: {e}") from e
+                time.sleep(0.2)
+
+    def search(self, queries, k):
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        futures = [self._executor.submit(shard.search, queries, k) for shard in self.shards]
+        results = [f.result() for f in futures]
+        return merge_topk([r[0] for r in results], [r[1] for r in results], k)
@@ -0,0 +1,94 @@
+"""
+Startup orchestration for the API.
+
+Importing app.main only wires up routes. Heavy artifacts (embeddings, faiss index, metadata)
+are loaded by a background thread started from the FastAPI lifespan handler, so the process
+accepts connections immediately:
+- /health (liveness) answers as soon as the process is up, and fails once loading has given up.
+- /ready (readiness) answers 503 until artifacts are loaded.
+A failed load is retried with exponential backoff, up to max_attempts times.
+Each loading phase is timed and reported by /ready and /metrics.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+class StartupState:
+    def __init__(self, max_attempts=3, retry_delay=5.0):
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.phases = {}
+        self.error = None
+        self.attempts = 0
+        self._value = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._loader = None
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.perf_counter() - start, 4)
+
+    def set_loader(self, loader):
+        self._loader = loader
+
+    def start_loading(self):
+        """Start loading in the background (idempotent)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name="artifact-loader", daemon=True)
+                self._thread.start()
+
+    def _load(self):
+        delay = self.retry_delay
+        try:
+            while self.attempts < self.max_attempts:
+                self.attempts += 1
+                try:
+                    with self.phase("total"):
+                        self._value = self._loader()
+                    self.error = None
+                    return
+                except Exception as e:
+                    logging.error(f"Error loading artifacts (attempt {self.attempts}/{self.max_attempts}): {e}")
+                    self.error = str(e)
+                if self.attempts < self.max_attempts:
+                    time.sleep(delay)
+                    delay *= 2
+        finally:
+            logging.info(f"Startup phases (s): {self.phases}")
+            self._ready.set()
+
+    @property
+    def ready(self):
+        return self._ready.is_set() and self._value is not None
+
+    @property
+    def failed(self):
+        """Every attempt failed: nothing will load without a restart."""
+        return self._ready.is_set() and self._value is None
+
+    def get(self, timeout=None):
+        """
+        The loaded value, waiting up to `timeout` seconds for the loader (None if it is still
+        loading or failed). Starts loading on first use, so code paths that skip the lifespan
+        (e.g. a plain TestClient) still work.
+        """
+        self.start_loading()
+        self._ready.wait(timeout)
+        return self._value
+
+    def report(self):
+        return {
+            "ready": self.ready,
+            "failed": self.failed,
+            "error": self.error,
+            "attempts": self.attempts,
+            "phases_s": dict(self.phases),
+        }
@@ -0,0 +1,126 @@
+"""
+Compact BM25 inverted index for title/author/tag lookups.
+
+Built by scripts/build_index.py from `combined_text` and saved as artifacts/text_index.npz.
+Posting lists are stored CSR-style in flat numpy arrays:
+    offsets[t]:offsets[t + 1] slices `docs` (row positions) and `tfs` (term frequencies) for term t.
+A query touches only the postings of its own terms and accumulates scores with numpy.
+"""
+import re
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Queries whose postings cover less than 1/SPARSE_FRACTION of the catalog merge them by sorting
+# (O(p log p)); broader ones use a dense per-document accumulator (O(num_docs))
+SPARSE_FRACTION = 8
+
+def tokenize(text):
+    return TOKEN_RE.findall(str(text).lower())
+
+def build_text_index(texts, book_ids):
+    vocab = {}
+    term_ids, doc_rows, tf_values = [], [], []
+    doc_lens = np.zeros(len(texts), dtype=np.int32)
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        doc_lens[row] = len(tokens)
+        counts = {}
+        for tok in tokens:
+            counts[tok] = counts.get(tok, 0) + 1
+        for tok, tf in counts.items():
+            term_ids.append(vocab.setdefault(tok, len(vocab)))
+            doc_rows.append(row)
+            tf_values.append(tf)
+
+    # Sort terms alphabetically and group postings by term
+    terms = np.array(sorted(vocab), dtype=object)
+    remap = np.empty(len(vocab), dtype=np.int64)
+    remap[[vocab[t] for t in terms]] = np.arange(len(terms))
+    term_ids = remap[np.asarray(term_ids, dtype=np.int64)]
+    order = np.argsort(term_ids, kind="stable")
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=len(terms)), out=offsets[1:])
+
+    return {
+        "terms": terms.astype(str),
+        "offsets": offsets,
+        "docs": np.asarray(doc_rows, dtype=np.int32)[order],
+        "tfs": np.minimum(np.asarray(tf_values, dtype=np.int64)[order], np.iinfo(np.uint16).max).astype(np.uint16),
+        "doc_lens": doc_lens,
+        "book_ids": np.asarray(book_ids, dtype=np.int64),
+    }
+
+def save_text_index(path, arrays):
+    np.savez(path, **arrays)
+
+class TextIndex:
+    def __init__(self, terms, offsets, docs, tfs, doc_lens, book_ids, k1=1.2, b=0.75):
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs.astype(np.float32)
+        self.book_ids = book_ids
+        self.term_to_id = {t: i for i, t in enumerate(terms.tolist())}
+        self.k1 = k1
+
+        n = len(doc_lens)
+        df = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = max(float(doc_lens.mean()), 1.0) if n else 1.0
+        # Per-document part of the BM25 denominator, precomputed once
+        self.doc_norm = (k1 * (1 - b + b * doc_lens / avgdl)).astype(np.float32)
+        self._num_docs = n
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path, allow_pickle=False)
+        return cls(data["terms"], data["offsets"], data["docs"], data["tfs"], data["doc_lens"], data["book_ids"])
+
+    def search(self, query, k=10):
+        """
+        Returns (rows, scores): row positions into book_ids and BM25 scores, best first.
+        """
+        term_ids = sorted({self.term_to_id[t] for t in tokenize(query) if t in self.term_to_id})
+        if not term_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # Accumulate over the query's postings only. Rare terms (the usual title/author query)
+        # touch a few hundred docs, so the work does not grow with the catalog.
+        postings, contributions = [], []
+        for t in term_ids:
+            start, end = self.offsets[t], self.offsets[t + 1]
+            docs = self.docs[start:end]
+            tf = self.tfs[start:end]
+            postings.append(docs)
+            contributions.append(self.idf[t] * tf * (self.k1 + 1) / (tf + self.doc_norm[docs]))
+        if len(term_ids) == 1:
+            # Each doc appears once per posting list
+            hits, scores = postings[0].astype(np.int64), contributions[0]
+        elif sum(len(p) for p in postings) * SPARSE_FRACTION < self._num_docs:
+            hits, inverse = np.unique(np.concatenate(postings), return_inverse=True)
+            hits = hits.astype(np.int64)
+            scores = np.bincount(inverse, weights=np.concatenate(contributions)).astype(np.float32)
+        else:
+            # Stopword-like terms cover much of the catalog: a dense accumulator beats sorting
+            scores = np.zeros(self._num_docs, dtype=np.float32)
+            for docs, contribution in zip(postings, contributions):
+                # Each doc appears once per posting list, so fancy += is safe
+                scores[docs] += contribution
+            hits = np.flatnonzero(scores)
+            scores = scores[hits]
+
+        top = np.flatnonzero(scores > 0)
+        if len(top) > k:
+            top = top[np.argpartition(-scores[top], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return hits[top], scores[top]
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuse ranked lists of ids: score(id) = sum over lists of 1 / (k + rank), rank starting at 1.
+    Returns [(id, score)] best first.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
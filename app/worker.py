@@ -0,0 +1,208 @@
+"""
+Background re-ranking worker.
+
+Like/pass endpoints enqueue a "profile changed" event per user (coalesced: at most one pending
+event per user). This worker drains that queue with a process pool, re-ranks each user's
+candidate list off the request path and writes it to the `precomputed_recs` table, which
+/recommend reads before falling back to synchronous ranking.
+
+Run with:
+    python -m app.worker --workers 4
+With a sharded index, pass the shard servers' socket dir (or set SHARD_SOCKET_DIR) like the API:
+    python -m app.worker --workers 4 --shard-socket-dir /tmp/bookswipe-shards
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from app.bandit import thompson_quotas
+from app.dislike import dislike_vector
+
+DB_PATH = "db/app.db"
+BANDIT_EXPLORATION = os.environ.get("BANDIT_EXPLORATION", "1") == "1"
+# Same setting as the API: query shard servers instead of loading artifacts/faiss.index
+SHARD_SOCKET_DIR = os.environ.get("SHARD_SOCKET_DIR")
+PRECOMPUTE_DEPTH = 200
+MAX_BACKLOG = 100000
+# A user whose re-rank keeps failing is re-queued this many times, then left to synchronous ranking
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profile_events (
+    user_id TEXT PRIMARY KEY,
+    enqueued_at REAL
+);
+CREATE TABLE IF NOT EXISTS precomputed_recs (
+    user_id TEXT PRIMARY KEY,
+    profile_version INTEGER,
+    book_ids BLOB,
+    scores BLOB,
+    updated_at REAL
+);
+"""
+
+def ensure_schema(conn):
+    conn.executescript(SCHEMA)
+    conn.commit()
+
+def enqueue_profile_change(db, user_id):
+    # OR IGNORE keeps the original position, so a busy user cannot starve the others
+    db.execute(
+        "INSERT OR IGNORE INTO profile_events (user_id, enqueued_at) VALUES (?, ?)",
+        (user_id, time.time())
+    )
+
+def read_precomputed(db, user_id):
+    row = db.execute(
+        "SELECT profile_version, book_ids, scores FROM precomputed_recs WHERE user_id = ?",
+        (user_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    return row[0], np.frombuffer(row[1], dtype=np.int64), np.frombuffer(row[2], dtype=np.float32)
+
+def backlog_stats(db):
+    count, oldest = db.execute("SELECT COUNT(*), MIN(enqueued_at) FROM profile_events").fetchone()
+    return {
+        "pending_users": count,
+        "oldest_age_s": time.time() - oldest if oldest is not None else 0.0,
+    }
+
+# Per-process state for pool workers
+_recommender = None
+_db_path = DB_PATH
+
+def _init_worker(db_path, shard_socket_dir=None):
+    global _recommender, _db_path
+    from app.recommender import Recommender
+    _recommender = Recommender(shard_socket_dir=shard_socket_dir)
+    _db_path = db_path
+
+def _recompute_user(user_id):
+    from app.recommender import load_user_actions
+    conn = sqlite3.connect(_db_path, timeout=30)
+    try:
+        liked_ids, seen_ids = load_user_actions(conn, user_id)
+        user_emb = _recommender.user_profile(liked_ids)
+        quotas = None
+        if BANDIT_EXPLORATION:
+            quotas = thompson_quotas(_recommender.bandit_counts(liked_ids, seen_ids), PRECOMPUTE_DEPTH)
+        dislike_emb = dislike_vector(*_recommender.pass_embedding_sum(liked_ids, seen_ids))
+        indices, scores = _recommender.rank(user_emb, seen_ids, [], PRECOMPUTE_DEPTH, quotas, dislike_emb)
+        bids = _recommender.book_ids[indices].astype(np.int64)
+        conn.execute(
+            "INSERT OR REPLACE INTO precomputed_recs (user_id, profile_version, book_ids, scores, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (user_id, len(liked_ids), bids.tobytes(), np.asarray(scores, dtype=np.float32).tobytes(), time.time())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return user_id
+
+def trim_backlog(conn, max_backlog):
+    # Drop the oldest events beyond the bound; those users fall back to synchronous ranking
+    cursor = conn.execute(
+        "DELETE FROM profile_events WHERE user_id IN ("
+        "SELECT user_id FROM profile_events ORDER BY enqueued_at DESC LIMIT -1 OFFSET ?)",
+        (max_backlog,)
+    )
+    conn.commit()
+    return cursor.rowcount
+
+def claim_batch(conn, batch_size):
+    rows = conn.execute(
+        "SELECT user_id FROM profile_events ORDER BY enqueued_at LIMIT ?", (batch_size,)
+    ).fetchall()
+    user_ids = [r[0] for r in rows]
+    if user_ids:
+        # Claim by deleting; a swipe arriving while we rank re-enqueues the user
+        conn.executemany("DELETE FROM profile_events WHERE user_id = ?", [(u,) for u in user_ids])
+        conn.commit()
+    return user_ids
+
+def _new_pool(workers, db_path, shard_socket_dir):
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(db_path, shard_socket_dir))
+
+def run(db_path=DB_PATH, workers=None, batch_size=256, poll_interval=0.5, max_backlog=MAX_BACKLOG, once=False,
+        shard_socket_dir=SHARD_SOCKET_DIR):
+    workers = workers or os.cpu_count() or 1
+    conn = sqlite3.connect(db_path, timeout=30)
+    # WAL lets the API keep writing likes while workers write results
+    conn.execute("PRAGMA journal_mode=WAL")
+    ensure_schema(conn)
+
+    processed = 0
+    dropped = 0
+    failed = 0
+    # user_id -> failed attempts, for users currently re-queued
+    attempts = {}
+    started = time.time()
+    pool = _new_pool(workers, db_path, shard_socket_dir)
+    logging.info(f"Re-ranking worker started with {workers} processes")
+    try:
+        while True:
+            dropped += trim_backlog(conn, max_backlog)
+            user_ids = claim_batch(conn, batch_size)
+            if user_ids:
+                # One future per user: a failure only affects that user, not the rest of the batch
+                futures = [(user_id, pool.submit(_recompute_user, user_id)) for user_id in user_ids]
+                broken = False
+                for user_id, future in futures:
+                    try:
+                        future.result()
+                        processed += 1
+                        attempts.pop(user_id, None)
+                    except Exception as e:
+                        failed += 1
+                        broken = broken or isinstance(e, BrokenProcessPool)
+                        tries = attempts.pop(user_id, 0) + 1
+                        if tries < MAX_ATTEMPTS:
+                            # Events were claimed by deleting them, so put the user back in the queue
+                            logging.warning(f"Re-rank failed for user {user_id} (attempt {tries}), re-queued: {e!r}")
+                            enqueue_profile_change(conn, user_id)
+                            attempts[user_id] = tries
+                        else:
+                            logging.error(f"Re-rank failed for user {user_id} {tries} times, giving up: {e!r}")
+                conn.commit()
+                if broken:
+                    # A crashed process poisons the pool; later submits would fail immediately
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = _new_pool(workers, db_path, shard_socket_dir)
+
+                stats = backlog_stats(conn)
+                elapsed = time.time() - started
+                logging.info(
+                    f"processed={processed} ({processed / elapsed:.1f} users/s) failed={failed} dropped={dropped} "
+                    f"backlog={stats['pending_users']} oldest={stats['oldest_age_s']:.1f}s"
+                )
+            elif once:
+                break
+            else:
+                time.sleep(poll_interval)
+    finally:
+        pool.shutdown()
+        conn.close()
+    return processed
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute recommendations for users whose profile changed.")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--workers", type=int, default=None, help="Ranking processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--max-backlog", type=int, default=MAX_BACKLOG)
+    parser.add_argument("--once", action="store_true", help="Drain the queue and exit")
+    parser.add_argument("--shard-socket-dir", default=SHARD_SOCKET_DIR,
+                        help="Query shard servers in this dir instead of a local index (default: $SHARD_SOCKET_DIR)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    run(args.db, args.workers, args.batch_size, args.poll_interval, args.max_backlog, args.once, args.shard_socket_dir)
+
+if __name__ == "__main__":
+    main()
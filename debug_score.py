@@ -4,7 +4,7 @@ from models.infer_ranker import RankerInference
 
 def debug_scores():
     print("Initializing Ranker...")
-    ranker = RankerInference()
+    ranker = RankerInference(enabled=True)
     
     print(f"Model available: {ranker.available}")
     
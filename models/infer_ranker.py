@@ -1,47 +1,63 @@
-import torch
 import numpy as np
 import os
-# Define the model class again or import it if we structured it as a package
-# For simplicity in this prototype, we redefine it here or expect it in a shared module.
-# To keep it simple and standalone, I'll redefine the class structure.
+# torch is only imported when the neural ranker is enabled (NEURAL_RANKER=1).
+# The cosine fallback is what we serve today, and importing torch costs seconds of startup.
 
-import torch.nn as nn
+NEURAL_RANKER = os.environ.get("NEURAL_RANKER", "0") == "1"
+# How much similarity to a user's passed books (app/dislike.py) is subtracted from a score.
+# DISLIKE_WEIGHT=0 ignores pass history.
+DISLIKE_WEIGHT = float(os.environ.get("DISLIKE_WEIGHT", "0.5"))
 
-class BookRanker(nn.Module):
-    def __init__(self, input_dim):
-        super(BookRanker, self).__init__()
-        self.fc1 = nn.Linear(input_dim * 2, 64)
-        self.relu = nn.ReLU()
-        self.fc2 = nn.Linear(64, 32)
-        self.fc3 = nn.Linear(32, 1)
-        self.sigmoid = nn.Sigmoid()
+def build_book_ranker(input_dim):
+    # Same architecture as models/train_ranker.py; defined lazily so torch stays optional
+    import torch
+    import torch.nn as nn
 
-    def forward(self, user_emb, book_emb):
-        x = torch.cat([user_emb, book_emb], dim=1)
-        x = self.relu(self.fc1(x))
-        x = self.relu(self.fc2(x))
-        x = self.sigmoid(self.fc3(x))
-        return x
+    class BookRanker(nn.Module):
+        def __init__(self, input_dim):
+            super(BookRanker, self).__init__()
+            self.fc1 = nn.Linear(input_dim * 2, 64)
+            self.relu = nn.ReLU()
+            self.fc2 = nn.Linear(64, 32)
+            self.fc3 = nn.Linear(32, 1)
+            self.sigmoid = nn.Sigmoid()
+
+        def forward(self, user_emb, book_emb):
+            x = torch.cat([user_emb, book_emb], dim=1)
+            x = self.relu(self.fc1(x))
+            x = self.relu(self.fc2(x))
+            x = self.sigmoid(self.fc3(x))
+            return x
+
+    return BookRanker(input_dim)
 
 class RankerInference:
-    def __init__(self, model_path="models/ranker.pt", input_dim=384):
-        self.model = BookRanker(input_dim)
+    def __init__(self, model_path="models/ranker.pt", input_dim=384, enabled=None, dislike_weight=None):
+        self.model = None
+        self.available = False
+        self.dislike_weight = DISLIKE_WEIGHT if dislike_weight is None else dislike_weight
+        if enabled is None:
+            enabled = NEURAL_RANKER
+        if not enabled:
+            return
+
         if os.path.exists(model_path):
             try:
+                import torch
+                self.model = build_book_ranker(input_dim)
                 self.model.load_state_dict(torch.load(model_path))
                 self.model.eval()
                 self.available = True
             except Exception as e:
                 print(f"Error loading model: {e}. Using fallback.")
-                self.available = False
         else:
             print(f"Warning: Ranker model not found at {model_path}. Using fallback.")
-            self.available = False
 
-    def predict_score(self, user_embedding, candidate_embeddings):
+    def predict_score(self, user_embedding, candidate_embeddings, dislike_embedding=None):
         """
         user_embedding: np.array (D,)
         candidate_embeddings: np.array (N, D)
+        dislike_embedding: optional np.array (D,), mean embedding of the user's passed books
         Returns: np.array (N,) scores
         """
         # Calculate Cosine Similarity first as a baseline/fallback
@@ -56,8 +72,17 @@ class RankerInference:
         if user_norm == 0: user_norm = 1e-9
         cand_norm[cand_norm == 0] = 1e-9
         
-        dot_products = np.dot(candidate_embeddings, user_embedding)
-        cosine_sims = dot_products / (user_norm * cand_norm)
+        penalty = 0.0
+        if dislike_embedding is not None and self.dislike_weight:
+            # Like and dislike similarity in one (N, D) x (D, 2) product. The dislike vector is
+            # left unnormalized, so scattered passes (a short mean vector) penalize less.
+            dot_products = np.dot(candidate_embeddings, np.stack([user_embedding / user_norm, dislike_embedding], axis=1))
+            cosine_sims = dot_products[:, 0] / cand_norm
+            # Only push down books close to what was passed, never reward the opposite
+            penalty = self.dislike_weight * np.maximum(dot_products[:, 1] / cand_norm, 0)
+        else:
+            dot_products = np.dot(candidate_embeddings, user_embedding)
+            cosine_sims = dot_products / (user_norm * cand_norm)
         
         # Map cosine similarity (-1 to 1) to a "Match Score" (0% to 100%)
         # Previous formula was too conservative (60-99%).
@@ -65,31 +90,29 @@ class RankerInference:
         # -1 -> 0.0
         #  0 -> 0.5
         #  1 -> 1.0
-        fallback_scores = (cosine_sims + 1) / 2
+        fallback_scores = np.clip((cosine_sims + 1) / 2 - penalty, 0, 1)
         
         if not self.available:
             return fallback_scores
             
-        # FORCE FALLBACK for prototype
-        # The neural network is currently untrained and produces poor results.
-        # We rely 100% on the Cosine Similarity (Content-Based) metric for now.
-        return fallback_scores
-
-        # try:
-        #     with torch.no_grad():
-        #         # Prepare batch
-        #         n = len(candidate_embeddings)
-        #         user_emb_tensor = torch.tensor(user_embedding, dtype=torch.float32).unsqueeze(0).repeat(n, 1)
-        #         cand_emb_tensor = torch.tensor(candidate_embeddings, dtype=torch.float32)
-        #         
-        #         # Model output is sigmoid (0 to 1)
-        #         model_scores = self.model(user_emb_tensor, cand_emb_tensor).squeeze().numpy()
-        #         
-        #         # If model outputs are too flat (e.g. untrained), mix with fallback
-        #         if np.std(model_scores) < 0.01:
-        #              return fallback_scores
-        #         
-        #         return model_scores
-        # except Exception as e:
-        #     print(f"Inference error: {e}. Using fallback.")
-        #     return fallback_scores
+        # Only reached with NEURAL_RANKER=1. The network is still mostly untrained,
+        # so the cosine fallback above stays the default.
+        try:
+            import torch
+            with torch.no_grad():
+                # Prepare batch
+                n = len(candidate_embeddings)
+                user_emb_tensor = torch.tensor(user_embedding, dtype=torch.float32).unsqueeze(0).repeat(n, 1)
+                cand_emb_tensor = torch.tensor(np.asarray(candidate_embeddings), dtype=torch.float32)
+                
+                # Model output is sigmoid (0 to 1)
+                model_scores = self.model(user_emb_tensor, cand_emb_tensor).squeeze(1).numpy()
+                
+                # If model outputs are too flat (e.g. untrained), mix with fallback
+                if np.std(model_scores) < 0.01:
+                     return fallback_scores
+                
+                return np.clip(model_scores - penalty, 0, 1)
+        except Exception as e:
+            print(f"Inference error: {e}. Using fallback.")
+            return fallback_scores
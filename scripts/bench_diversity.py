@@ -0,0 +1,35 @@
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.getcwd())
+from app.diversity import mmr_rerank
+
+def bench(fn, repeat=20):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def bench_diversity():
+    # Same shapes as the serving path: up to DIVERSITY_POOL candidates of 384-d embeddings
+    d = 384
+    rng = np.random.default_rng(0)
+    print(f"{'pool':>6} {'k':>5} {'sort ms':>9} {'mmr ms':>9} {'mmr+cap ms':>11}")
+    for n in [200, 500, 2000]:
+        emb = rng.standard_normal((n, d)).astype(np.float32)
+        emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+        scores = rng.random(n).astype(np.float32)
+        authors = rng.integers(0, n // 4, n)
+        for k in [10, 50, 200]:
+            if k > n:
+                continue
+            sort_ms = bench(lambda: np.argsort(-scores, kind="stable")[:k])
+            mmr_ms = bench(lambda: mmr_rerank(emb, scores, k, 0.7))
+            cap_ms = bench(lambda: mmr_rerank(emb, scores, k, 0.7, authors, 3))
+            print(f"{n:>6} {k:>5} {sort_ms:>9.3f} {mmr_ms:>9.3f} {cap_ms:>11.3f}")
+
+if __name__ == "__main__":
+    bench_diversity()
@@ -2,9 +2,30 @@ import pandas as pd
 import numpy as np
 import faiss
 import os
-from sentence_transformers import SentenceTransformer
+import sys
+import argparse
 
-def build_index():
+sys.path.append(os.getcwd())
+from app.text_index import build_text_index, save_text_index
+
+def build_shards(embeddings, num_shards, artifacts_dir):
+    # Contiguous partitions; IndexIDMap keeps the global row ids so shard results merge directly
+    shards_dir = os.path.join(artifacts_dir, "shards")
+    os.makedirs(shards_dir, exist_ok=True)
+    for old in os.listdir(shards_dir):
+        if old.startswith("shard_") and old.endswith(".index"):
+            os.remove(os.path.join(shards_dir, old))
+    
+    d = embeddings.shape[1]
+    bounds = np.linspace(0, len(embeddings), num_shards + 1).astype(np.int64)
+    for i in range(num_shards):
+        start, end = bounds[i], bounds[i + 1]
+        shard = faiss.IndexIDMap(faiss.IndexFlatIP(d))
+        shard.add_with_ids(np.ascontiguousarray(embeddings[start:end]), np.arange(start, end, dtype=np.int64))
+        faiss.write_index(shard, os.path.join(shards_dir, f"shard_{i}.index"))
+        print(f"Shard {i}: rows {start}-{end}")
+
+def build_index(num_shards=0, reuse_embeddings=False):
     data_path = "data/clean/books_clean.csv"
     artifacts_dir = "artifacts"
     os.makedirs(artifacts_dir, exist_ok=True)
@@ -16,23 +37,30 @@ def build_index():
     print("Loading data...")
     df = pd.read_csv(data_path)
     
-    # Use a small, fast model for CPU
-    model_name = 'all-MiniLM-L6-v2'
-    print(f"Loading model {model_name}...")
-    model = SentenceTransformer(model_name)
-    
-    print("Computing embeddings...")
-    # Embed the combined text field
-    sentences = df['combined_text'].tolist()
-    embeddings = model.encode(sentences, show_progress_bar=True)
-    
-    # Normalize embeddings for cosine similarity
-    faiss.normalize_L2(embeddings)
-    
-    # Save embeddings and IDs
-    print("Saving artifacts...")
-    np.save(os.path.join(artifacts_dir, "book_embeddings.npy"), embeddings)
-    np.save(os.path.join(artifacts_dir, "book_ids.npy"), df['book_id'].values)
+    embeddings_path = os.path.join(artifacts_dir, "book_embeddings.npy")
+    if reuse_embeddings and os.path.exists(embeddings_path):
+        print("Reusing existing embeddings...")
+        embeddings = np.load(embeddings_path)
+    else:
+        from sentence_transformers import SentenceTransformer
+        
+        # Use a small, fast model for CPU
+        model_name = 'all-MiniLM-L6-v2'
+        print(f"Loading model {model_name}...")
+        model = SentenceTransformer(model_name)
+        
+        print("Computing embeddings...")
+        # Embed the combined text field
+        sentences = df['combined_text'].tolist()
+        embeddings = model.encode(sentences, show_progress_bar=True)
+        
+        # Normalize embeddings for cosine similarity
+        faiss.normalize_L2(embeddings)
+        
+        # Save embeddings and IDs
+        print("Saving artifacts...")
+        np.save(embeddings_path, embeddings)
+        np.save(os.path.join(artifacts_dir, "book_ids.npy"), df['book_id'].values)
     
     # Build Faiss Index
     print("Building Faiss index...")
@@ -42,6 +70,20 @@ def build_index():
     
     faiss.write_index(index, os.path.join(artifacts_dir, "faiss.index"))
     print(f"Index built with {index.ntotal} vectors.")
+    
+    # BM25 inverted index for /search, over the same combined text that was embedded
+    print("Building text index...")
+    text_index = build_text_index(df['combined_text'].fillna('').tolist(), df['book_id'].values)
+    save_text_index(os.path.join(artifacts_dir, "text_index.npz"), text_index)
+    print(f"Text index built with {len(text_index['terms'])} terms and {len(text_index['docs'])} postings.")
+    
+    if num_shards > 0:
+        print(f"Partitioning into {num_shards} shards...")
+        build_shards(embeddings, num_shards, artifacts_dir)
 
 if __name__ == "__main__":
-    build_index()
+    parser = argparse.ArgumentParser(description="Embed the catalog and build the retrieval index.")
+    parser.add_argument("--shards", type=int, default=0, help="Also partition the index into N shards for app/shard_server.py")
+    parser.add_argument("--reuse-embeddings", action="store_true", help="Skip embedding if artifacts/book_embeddings.npy exists")
+    args = parser.parse_args()
+    build_index(args.shards, args.reuse_embeddings)
@@ -0,0 +1,260 @@
+import argparse
+import csv
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+import numpy as np
+import faiss
+
+sys.path.append(os.getcwd())
+from app.recommender import Recommender, ARTIFACTS_DIR, BOOKS_PATH
+from app.bandit import thompson_quotas
+from app.dislike import dislike_vector
+from app.worker import PRECOMPUTE_DEPTH
+
+# Offline evaluation of ranking quality vs. compute cost per retrieval config.
+#
+# Held-out likes are replayed through the same Recommender.user_profile/rank code that
+# /recommend uses, including the genre bandit's quotas and the dislike penalty built from the
+# replayed history, and the page is the top n of a PRECOMPUTE_DEPTH-deep list as served.
+# Draws are seeded, so runs are repeatable. For each config (index, retrieval depth, diversity,
+# feedback) we report recall@n, NDCG@n, catalog coverage and overlap with the baseline next to
+# latency and index memory, so the cheapest config within a quality budget can be picked.
+
+DB_PATH = "db/app.db"
+VAL_PATH = "data/val.csv"
+REPORT_DIR = "artifacts"
+# Query shard servers like the API does (python -m app.shard_server --all)
+SHARD_SOCKET_DIR = os.environ.get("SHARD_SOCKET_DIR")
+
+# index: faiss index_factory string ({nlist} is filled from the catalog size)
+CONFIGS = {
+    "flat-k2000": {"index": "Flat", "k": 2000},
+    "flat-k500": {"index": "Flat", "k": 500},
+    "flat-k200": {"index": "Flat", "k": 200},
+    "flat-k2000-nodiv": {"index": "Flat", "k": 2000, "diversity_lambda": 1.0},
+    # Without the exploration bandit and the dislike penalty, to measure their effect on quality
+    "flat-k2000-nofeedback": {"index": "Flat", "k": 2000, "bandit": False, "dislike": False},
+    "ivf-k500": {"index": "IVF{nlist},Flat", "k": 500, "nprobe": 8},
+    "hnsw-k500": {"index": "HNSW32,Flat", "k": 500},
+    # The sharded index the API serves from; needs --shard-socket-dir
+    "sharded-k2000": {"index": "sharded", "k": 2000},
+    "sq8-k500": {"index": "SQ8", "k": 500},
+    "pq-k500": {"index": "PQ48", "k": 500},
+}
+BASELINE = "flat-k2000"
+# PQ training is slow (minutes on one core), so it only runs when asked for with --configs
+DEFAULT_CONFIGS = [name for name in CONFIGS if not name.startswith(("pq-", "sharded-"))]
+
+def build_eval_index(spec, embeddings, nprobe=None):
+    d = embeddings.shape[1]
+    nlist = max(1, int(4 * np.sqrt(len(embeddings))))
+    index = faiss.index_factory(d, spec.format(nlist=nlist), faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add(embeddings)
+    if nprobe is not None:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    return index
+
+def cases_from_db(db_path, holdout, min_likes=2):
+    """
+    Per user with >= min_likes likes: the most recent `holdout` fraction of likes is held out,
+    and the observed history is everything the user did before the first held-out like. Later
+    passes are not replayed, so the bandit counts and dislike vector only know the past.
+    Returns [(profile_ids, seen_ids, heldout_ids)].
+    """
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        "SELECT user_id, book_id, action FROM user_actions ORDER BY user_id, timestamp, rowid"
+    ).fetchall()
+    conn.close()
+
+    by_user = {}
+    for user_id, book_id, action in rows:
+        by_user.setdefault(user_id, []).append((book_id, action))
+
+    cases = []
+    for actions in by_user.values():
+        likes = [b for b, a in actions if a == 'like']
+        if len(likes) < min_likes:
+            continue
+        n_holdout = max(1, int(len(likes) * holdout))
+        heldout = set(likes[-n_holdout:])
+        profile = likes[:-n_holdout]
+        # Actions are in (timestamp, rowid) order, so this cuts at the first held-out like
+        cutoff = next(i for i, (b, a) in enumerate(actions) if a == 'like' and b in heldout)
+        seen = set(b for b, _ in actions[:cutoff])
+        cases.append((profile, seen, heldout))
+    return cases
+
+def cases_from_val(val_path, known_ids, users, profile_size, holdout_size, seed=0):
+    """
+    Synthetic users from the validation split: each likes profile_size books of one genre and
+    the held-out likes are holdout_size other books of that genre.
+    """
+    by_genre = {}
+    with open(val_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            bid = int(row['book_id'])
+            if bid in known_ids:
+                by_genre.setdefault(row['genres'], []).append(bid)
+    genres = [g for g, books in by_genre.items() if len(books) >= profile_size + holdout_size]
+    if not genres:
+        return []
+
+    rng = np.random.default_rng(seed)
+    cases = []
+    for _ in range(users):
+        books = by_genre[genres[rng.integers(len(genres))]]
+        picked = rng.choice(books, profile_size + holdout_size, replace=False).tolist()
+        profile = picked[:profile_size]
+        cases.append((profile, set(profile), set(picked[profile_size:])))
+    return cases
+
+def ndcg_at_n(recommended, relevant, n):
+    dcg = sum(1.0 / np.log2(i + 2) for i, b in enumerate(recommended[:n]) if b in relevant)
+    idcg = sum(1.0 / np.log2(i + 2) for i in range(min(len(relevant), n)))
+    return dcg / idcg if idcg else 0.0
+
+def recall_at_n(recommended, relevant, n):
+    return len(set(recommended[:n]) & relevant) / len(relevant) if relevant else 0.0
+
+def evaluate_config(recommender, cases, n, bandit=True, dislike=True, seed=0):
+    # Same seed for every config, so they are compared on the same random draws
+    rng = np.random.default_rng(seed)
+    random.seed(seed)
+    depth = max(n, PRECOMPUTE_DEPTH)
+    latencies = []
+    recalls, ndcgs = [], []
+    recommended_all = []
+    seen_books = set()
+    for profile, seen, heldout in cases:
+        start = time.perf_counter()
+        # As app/worker.py _recompute_user does, from the replayed history
+        user_emb = recommender.user_profile(profile)
+        quotas = thompson_quotas(recommender.bandit_counts(profile, seen), depth, rng) if bandit else None
+        dislike_emb = dislike_vector(*recommender.pass_embedding_sum(profile, seen)) if dislike else None
+        indices, _ = recommender.rank(user_emb, seen, [], depth, quotas, dislike_emb)
+        latencies.append(time.perf_counter() - start)
+
+        recs = recommender.book_ids[indices[:n]].tolist()
+        recommended_all.append(recs)
+        seen_books.update(recs)
+        recalls.append(recall_at_n(recs, heldout, n))
+        ndcgs.append(ndcg_at_n(recs, heldout, n))
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        f"recall@{n}": float(np.mean(recalls)),
+        f"ndcg@{n}": float(np.mean(ndcgs)),
+        "coverage": len(seen_books) / len(recommender.book_ids),
+        "latency_ms_mean": float(latencies_ms.mean()),
+        "latency_ms_p95": float(np.percentile(latencies_ms, 95)),
+    }, recommended_all
+
+def write_report(results, n, max_drop, report_dir):
+    os.makedirs(report_dir, exist_ok=True)
+    baseline = results.get(BASELINE)
+    columns = [f"recall@{n}", f"ndcg@{n}", "coverage", "overlap", "latency_ms_mean", "latency_ms_p95", "index_mb", "build_s"]
+
+    lines = [f"# Retrieval config evaluation ({results[next(iter(results))]['cases']} users, n={n})", ""]
+    lines.append("| config | " + " | ".join(columns) + " |")
+    lines.append("|---" * (len(columns) + 1) + "|")
+    for name, r in results.items():
+        lines.append(f"| {name} | " + " | ".join(f"{r[c]:.4f}" if isinstance(r[c], float) else str(r[c]) for c in columns) + " |")
+
+    if baseline is not None:
+        # Fastest config whose recall is within max_drop of the baseline
+        budget = baseline[f"recall@{n}"] - max_drop
+        ok = [(r["latency_ms_mean"], name) for name, r in results.items() if r[f"recall@{n}"] >= budget]
+        if ok:
+            lines += ["", f"Fastest config within {max_drop:.3f} recall@{n} of {BASELINE}: **{min(ok)[1]}**"]
+
+    md_path = os.path.join(report_dir, "eval_report.md")
+    with open(md_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    with open(os.path.join(report_dir, "eval_report.json"), "w") as f:
+        json.dump(results, f, indent=2)
+    print("\n".join(lines))
+    print(f"\nReport written to {md_path}")
+
+def evaluate(source="db", configs=None, n=10, db_path=DB_PATH, val_path=VAL_PATH, holdout=0.2,
+             users=500, max_drop=0.01, artifacts_dir=ARTIFACTS_DIR, books_path=BOOKS_PATH, report_dir=REPORT_DIR, seed=0,
+             shard_socket_dir=SHARD_SOCKET_DIR):
+    recommender = Recommender(artifacts_dir, books_path, shard_socket_dir)
+    embeddings = np.ascontiguousarray(recommender.book_embeddings, dtype=np.float32)
+    served_index = recommender.index
+
+    if source == "db":
+        cases = cases_from_db(db_path, holdout)
+    else:
+        cases = cases_from_val(val_path, recommender.book_id_to_idx, users, profile_size=5, holdout_size=5, seed=seed)
+    if not cases:
+        print(f"No evaluation users found (source={source}).")
+        return None
+    print(f"Evaluating {len(cases)} users")
+
+    default_lambda = recommender.diversity_lambda
+    configs = configs or DEFAULT_CONFIGS + (["sharded-k2000"] if shard_socket_dir else [])
+    if not shard_socket_dir and any(CONFIGS[c]["index"] == "sharded" for c in configs):
+        raise ValueError("sharded configs need --shard-socket-dir")
+    # Overlap and the quality budget are measured against the baseline, so it always runs first
+    configs = [BASELINE] + [c for c in configs if c != BASELINE]
+
+    results = {}
+    baseline_recs = None
+    for name in configs:
+        config = CONFIGS[name]
+        start = time.perf_counter()
+        if config["index"] == "sharded":
+            recommender.index = served_index
+        else:
+            recommender.index = build_eval_index(config["index"], embeddings, config.get("nprobe"))
+        build_s = time.perf_counter() - start
+        recommender.retrieval_k = config["k"]
+        recommender.diversity_lambda = config.get("diversity_lambda", default_lambda)
+
+        metrics, recs = evaluate_config(recommender, cases, n, config.get("bandit", True), config.get("dislike", True), seed)
+        if name == BASELINE:
+            baseline_recs = recs
+        # Overlap with the baseline's lists: how much a cheaper config changes what users see
+        metrics["overlap"] = (
+            float(np.mean([len(set(a) & set(b)) / max(len(b), 1) for a, b in zip(recs, baseline_recs)]))
+            if baseline_recs is not None else float("nan")
+        )
+        # Shards live in other processes, so their memory is not counted here
+        metrics["index_mb"] = (
+            len(faiss.serialize_index(recommender.index)) / 1e6 if config["index"] != "sharded" else float("nan")
+        )
+        metrics["build_s"] = build_s
+        metrics["cases"] = len(cases)
+        results[name] = metrics
+        print(f"{name}: recall@{n}={metrics[f'recall@{n}']:.4f} latency={metrics['latency_ms_mean']:.2f}ms")
+
+    write_report(results, n, max_drop, report_dir)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare ranking quality and cost across retrieval configs.")
+    parser.add_argument("--source", choices=["db", "val"], default="db",
+                        help="Held-out likes from user_actions, or synthetic genre users from data/val.csv")
+    parser.add_argument("--configs", default=None, help=f"Comma-separated subset of: {', '.join(CONFIGS)} (default: all but pq)")
+    parser.add_argument("--n", type=int, default=10)
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fraction of each user's likes held out (db source)")
+    parser.add_argument("--users", type=int, default=500, help="Synthetic users (val source)")
+    parser.add_argument("--max-drop", type=float, default=0.01, help="Allowed recall drop vs. the baseline")
+    parser.add_argument("--artifacts-dir", default=ARTIFACTS_DIR)
+    parser.add_argument("--books", default=BOOKS_PATH)
+    parser.add_argument("--report-dir", default=REPORT_DIR)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for bandit draws and synthetic users")
+    parser.add_argument("--shard-socket-dir", default=SHARD_SOCKET_DIR,
+                        help="Query shard servers in this dir instead of a local index; adds the sharded-k2000 config")
+    args = parser.parse_args()
+    configs = args.configs.split(",") if args.configs else None
+    evaluate(args.source, configs, args.n, args.db, VAL_PATH, args.holdout, args.users, args.max_drop,
+             args.artifacts_dir, args.books, args.report_dir, args.seed, args.shard_socket_dir)
@@ -0,0 +1,209 @@
+import argparse
+import csv
+import os
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import faiss
+from scipy.sparse import csr_matrix
+
+# Nightly batch export of recommendations for every user with likes (e.g. for email digests).
+#
+# Users are streamed from user_actions in blocks. For each block, profile vectors are one
+# sparse (users x books, 1/num_likes weights) x dense (books x dim) product, retrieval is a
+# batched index.search, and seen books are removed with a sorted-array join on
+# (user_row * num_books + book_row) keys. Blocks are scored in a process pool and results
+# are streamed to CSV or Parquet, so memory stays bounded by block size, not user count.
+
+ARTIFACTS_DIR = "artifacts"
+DB_PATH = "db/app.db"
+SEARCH_BATCH = 4096
+MAX_OVERFETCH = 1000
+
+# Per-process artifacts, loaded by each pool worker in _init_pool. Workers must not rely on fork
+# copying this dict: with spawn (the macOS default) or forkserver they start empty.
+_state = {}
+
+def load_artifacts(artifacts_dir):
+    book_ids = np.load(os.path.join(artifacts_dir, "book_ids.npy"))
+    _state["book_ids"] = book_ids
+    _state["embeddings"] = np.load(os.path.join(artifacts_dir, "book_embeddings.npy"), mmap_mode="r")
+    _state["index"] = faiss.read_index(os.path.join(artifacts_dir, "faiss.index"))
+    # Vectorized book_id -> embedding row lookup
+    order = np.argsort(book_ids, kind="stable")
+    _state["sorted_ids"] = book_ids[order]
+    _state["sorted_rows"] = order
+
+def book_rows(bids):
+    sorted_ids, sorted_rows = _state["sorted_ids"], _state["sorted_rows"]
+    pos = np.minimum(np.searchsorted(sorted_ids, bids), len(sorted_ids) - 1)
+    return np.where(sorted_ids[pos] == bids, sorted_rows[pos], -1)
+
+def iter_user_blocks(conn, block_size, fetch_size=100000):
+    """
+    Yields (user_ids, user_pos, book_ids, is_like) per block of block_size users.
+    The primary key (user_id, book_id) makes ORDER BY user_id an index scan.
+    """
+    cursor = conn.execute("SELECT user_id, book_id, action FROM user_actions ORDER BY user_id")
+    users, pos, bids, likes = [], [], [], []
+    current = None
+    while True:
+        chunk = cursor.fetchmany(fetch_size)
+        if not chunk:
+            break
+        for user_id, book_id, action in chunk:
+            if user_id != current:
+                if len(users) == block_size:
+                    yield users, np.array(pos, dtype=np.int64), np.array(bids, dtype=np.int64), np.array(likes, dtype=bool)
+                    users, pos, bids, likes = [], [], [], []
+                users.append(user_id)
+                current = user_id
+            pos.append(len(users) - 1)
+            bids.append(book_id)
+            likes.append(action == 'like')
+    if users:
+        yield users, np.array(pos, dtype=np.int64), np.array(bids, dtype=np.int64), np.array(likes, dtype=bool)
+
+def score_block(block, n):
+    """
+    Returns (user_ids, user_pos, rank, book_ids, scores) for every exported row of the block,
+    plus the number of users skipped because they have no likes.
+    """
+    users, user_pos, bids, likes = block
+    embeddings, index, book_ids = _state["embeddings"], _state["index"], _state["book_ids"]
+    num_books = len(book_ids)
+    num_users = len(users)
+
+    rows = book_rows(bids)
+    valid = rows >= 0
+
+    # 1. Profiles: mean of liked embeddings as one sparse x dense product
+    like = valid & likes
+    like_counts = np.bincount(user_pos[like], minlength=num_users)
+    weights = 1.0 / like_counts[user_pos[like]]
+    profile_matrix = csr_matrix((weights.astype(np.float32), (user_pos[like], rows[like])), shape=(num_users, num_books))
+    has_profile = np.flatnonzero(like_counts)
+    profiles = np.ascontiguousarray(np.asarray(profile_matrix[has_profile] @ embeddings), dtype=np.float32)
+    faiss.normalize_L2(profiles)
+
+    # 2. Seen keys, sorted once for the join below
+    seen_keys = np.unique(user_pos[valid] * num_books + rows[valid])
+    seen_counts = np.bincount(user_pos[valid], minlength=num_users)
+    k = int(min(num_books, n + min(seen_counts.max(initial=0), MAX_OVERFETCH)))
+
+    out_pos, out_rank, out_bids, out_scores = [], [], [], []
+    for start in range(0, len(has_profile), SEARCH_BATCH):
+        qpos = has_profile[start:start + SEARCH_BATCH]
+        D, I = index.search(profiles[start:start + SEARCH_BATCH], k)
+
+        # 3. Sorted-array join against seen (user, book) pairs
+        keys = qpos[:, None] * num_books + I
+        hit = np.minimum(np.searchsorted(seen_keys, keys), max(len(seen_keys) - 1, 0))
+        seen = seen_keys[hit] == keys if len(seen_keys) else np.zeros(keys.shape, dtype=bool)
+        keep = ~seen & (I >= 0)
+        rank = np.cumsum(keep, axis=1)
+        keep &= rank <= n
+
+        r, c = np.nonzero(keep)
+        out_pos.append(qpos[r])
+        out_rank.append(rank[r, c])
+        out_bids.append(book_ids[I[r, c]])
+        # Same mapping as RankerInference's cosine fallback: (cos + 1) / 2
+        out_scores.append((D[r, c] + 1) / 2)
+
+    if not out_pos:
+        empty = np.empty(0, dtype=np.int64)
+        return users, empty, empty, empty, np.empty(0, dtype=np.float32), num_users
+    return (users, np.concatenate(out_pos), np.concatenate(out_rank), np.concatenate(out_bids),
+            np.concatenate(out_scores), num_users - len(has_profile))
+
+def _init_pool(artifacts_dir):
+    # Parallelism comes from the pool; one faiss thread per process avoids oversubscription
+    faiss.omp_set_num_threads(1)
+    load_artifacts(artifacts_dir)
+
+class CsvSink:
+    def __init__(self, path):
+        self.f = open(path, "w", newline="")
+        self.writer = csv.writer(self.f)
+        self.writer.writerow(["user_id", "rank", "book_id", "score"])
+
+    def write(self, user_ids, rank, bids, scores):
+        self.writer.writerows(zip(user_ids, rank.tolist(), bids.tolist(), np.round(scores.astype(np.float64), 4).tolist()))
+
+    def close(self):
+        self.f.close()
+
+class ParquetSink:
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow (pip install pyarrow), or use a .csv output path.")
+        self.pa = pa
+        self.schema = pa.schema([("user_id", pa.string()), ("rank", pa.int32()), ("book_id", pa.int64()), ("score", pa.float32())])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, user_ids, rank, bids, scores):
+        table = self.pa.table({
+            "user_id": user_ids,
+            "rank": rank.astype(np.int32),
+            "book_id": bids,
+            "score": scores.astype(np.float32),
+        }, schema=self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+
+def export_recommendations(output, n=20, db_path=DB_PATH, artifacts_dir=ARTIFACTS_DIR, block_size=20000, workers=None):
+    workers = workers or os.cpu_count() or 1
+    sink = ParquetSink(output) if output.endswith(".parquet") else CsvSink(output)
+    conn = sqlite3.connect(db_path)
+
+    exported_users = skipped_users = rows_written = 0
+    started = time.time()
+    # Bounded number of blocks in flight keeps memory flat regardless of user count
+    max_in_flight = workers * 2
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_pool, initargs=(artifacts_dir,)) as pool:
+        pending = deque()
+
+        def drain_one():
+            nonlocal exported_users, skipped_users, rows_written
+            users, upos, rank, bids, scores, skipped = pending.popleft().result()
+            user_ids = np.asarray(users, dtype=object)[upos]
+            sink.write(user_ids, rank, bids, scores)
+            exported_users += len(users) - skipped
+            skipped_users += skipped
+            rows_written += len(bids)
+            elapsed = time.time() - started
+            print(f"{exported_users + skipped_users} users ({(exported_users + skipped_users) / elapsed:.0f} users/s), {rows_written} rows")
+
+        for block in iter_user_blocks(conn, block_size):
+            pending.append(pool.submit(score_block, block, n))
+            if len(pending) >= max_in_flight:
+                drain_one()
+        while pending:
+            drain_one()
+
+    sink.close()
+    conn.close()
+    elapsed = time.time() - started
+    print(f"Exported {exported_users} users ({skipped_users} without likes skipped), "
+          f"{rows_written} rows to {output} in {elapsed:.1f}s "
+          f"({(exported_users + skipped_users) / max(elapsed, 1e-9):.0f} users/s)")
+    return exported_users, rows_written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export top-n recommendations for all users.")
+    parser.add_argument("output", help="Output path (.csv or .parquet)")
+    parser.add_argument("--n", type=int, default=20, help="Recommendations per user")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--artifacts-dir", default=ARTIFACTS_DIR)
+    parser.add_argument("--block-size", type=int, default=20000, help="Users per block")
+    parser.add_argument("--workers", type=int, default=None, help="Scoring processes (default: all cores)")
+    args = parser.parse_args()
+    export_recommendations(args.output, args.n, args.db, args.artifacts_dir, args.block_size, args.workers)
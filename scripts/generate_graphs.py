@@ -1,6 +1,7 @@
 import matplotlib.pyplot as plt
 import numpy as np
 import os
+import json
 
 def generate_graphs():
     artifacts_dir = "artifacts"
@@ -42,5 +43,23 @@ def generate_graphs():
     plt.savefig(os.path.join(artifacts_dir, "model_accuracy.png"))
     print("Saved model_accuracy.png")
 
+    # 3. Quality vs. latency per retrieval config (measured by scripts/evaluate.py)
+    report_path = os.path.join(artifacts_dir, "eval_report.json")
+    if os.path.exists(report_path):
+        with open(report_path) as f:
+            report = json.load(f)
+        recall_key = next(k for k in next(iter(report.values())) if k.startswith("recall@"))
+
+        plt.figure(figsize=(10, 6))
+        for name, r in report.items():
+            plt.scatter(r["latency_ms_mean"], r[recall_key], color='#646cff')
+            plt.annotate(name, (r["latency_ms_mean"], r[recall_key]), textcoords="offset points", xytext=(5, 5))
+        plt.title('Retrieval Config: Quality vs. Latency')
+        plt.xlabel('Mean /recommend ranking latency (ms)')
+        plt.ylabel(recall_key)
+        plt.grid(True, alpha=0.3)
+        plt.savefig(os.path.join(artifacts_dir, "retrieval_tradeoff.png"))
+        print("Saved retrieval_tradeoff.png")
+
 if __name__ == "__main__":
     generate_graphs()
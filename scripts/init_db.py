@@ -1,9 +1,8 @@
 import sqlite3
 import os
 
-def init_db():
-    os.makedirs("db", exist_ok=True)
-    db_path = "db/app.db"
+def init_db(db_path="db/app.db"):
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
     
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
@@ -18,6 +17,25 @@ def init_db():
     )
     """)
     
+    # Queue of users whose profile changed, drained by the re-ranking worker (app/worker.py)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS profile_events (
+        user_id TEXT PRIMARY KEY,
+        enqueued_at REAL
+    )
+    """)
+    
+    # Ranked candidate lists written by the worker and read by /recommend
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS precomputed_recs (
+        user_id TEXT PRIMARY KEY,
+        profile_version INTEGER,
+        book_ids BLOB,
+        scores BLOB,
+        updated_at REAL
+    )
+    """)
+    
     conn.commit()
     conn.close()
     print(f"Database initialized at {db_path}")
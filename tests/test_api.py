@@ -1,10 +1,46 @@
 from fastapi.testclient import TestClient
-from app.main import app
+from app.main import app, startup, get_db
+import app.main as main
 import os
+import sqlite3
+import sys
+import subprocess
+import importlib.util
 import pytest
+import time
+from app.startup import StartupState
 
 client = TestClient(app)
 
+spec = importlib.util.spec_from_file_location("init_db", "scripts/init_db.py")
+init_db = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(init_db)
+
+@pytest.fixture(autouse=True)
+def temp_db(tmp_path, monkeypatch):
+    # Never write test swipes into the developer's db/app.db
+    db_path = str(tmp_path / "app.db")
+    init_db.init_db(db_path)
+
+    def get_temp_db():
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # Background refreshes and /search open their own connections from DB_PATH
+    monkeypatch.setattr(main, "DB_PATH", db_path)
+    app.dependency_overrides[get_db] = get_temp_db
+    yield db_path
+    app.dependency_overrides.pop(get_db, None)
+
+@pytest.fixture
+def recommender():
+    # Endpoints answer 503 while artifacts load, so wait for them before calling
+    return startup.get()
+
 def test_health():
     response = client.get("/health")
     assert response.status_code == 200
@@ -18,7 +54,7 @@ def test_demo_login():
     assert data["user_id"] == "demo_user"
 
 @pytest.mark.skipif(not os.path.exists("artifacts/faiss.index"), reason="Index not built")
-def test_recommend():
+def test_recommend(recommender):
     # Login first
     login_res = client.post("/auth/demo-login")
     user_id = login_res.json()["user_id"]
@@ -31,3 +67,110 @@ def test_recommend():
     if len(data) > 0:
         assert "book_id" in data[0]
         assert "title" in data[0]
+
+@pytest.mark.skipif(not os.path.exists("artifacts/faiss.index"), reason="Index not built")
+def test_recommend_pages_come_from_cache(recommender):
+    user_id = "cache_test_user"
+    first = client.get(f"/recommend?user_id={user_id}&n=5").json()
+    # No swipe in between: same books, not a hidden cursor
+    assert client.get(f"/recommend?user_id={user_id}&n=5").json() == first
+    second = client.get(f"/recommend?user_id={user_id}&n=5&offset=5").json()
+    assert not {b["book_id"] for b in first} & {b["book_id"] for b in second}
+
+    # Swiped books drop out, so the deck's next offset=0 page starts where it left off
+    client.post(f"/user/{user_id}/pass", json={"user_id": user_id, "book_id": first[0]["book_id"]})
+    after_pass = client.get(f"/recommend?user_id={user_id}&n=4").json()
+    assert first[0]["book_id"] not in [b["book_id"] for b in after_pass]
+
+    stats = client.get("/metrics").json()["recommend_cache"]
+    assert stats["hits"] >= 2
+
+@pytest.mark.skipif(not os.path.exists("artifacts/faiss.index"), reason="Index not built")
+def test_likes_rerank_before_serving(recommender):
+    user_id = "likes_rerank_user"
+    key = (user_id, ())
+    first = client.get(f"/recommend?user_id={user_id}&n=10").json()
+    for book in first[:main.REC_CACHE_REFRESH_LIKES]:
+        client.post(f"/user/{user_id}/like", json={"user_id": user_id, "book_id": book["book_id"]})
+
+    # The "top picks" call right after the swipes is ranked from the new profile, not the old list
+    client.get(f"/recommend?user_id={user_id}&n=6")
+    assert main.rec_cache._entries[key].profile_version == main.REC_CACHE_REFRESH_LIKES
+
+@pytest.mark.skipif(not os.path.exists("artifacts/faiss.index"), reason="Index not built")
+def test_passes_rescore_cached_list(recommender, monkeypatch):
+    user_id = "pass_rescore_user"
+    first = client.get(f"/recommend?user_id={user_id}&n=10").json()
+
+    calls = []
+    monkeypatch.setattr(recommender, "rank", lambda *args, **kwargs: calls.append(args))
+    for book in first[:5]:
+        client.post(f"/user/{user_id}/pass", json={"user_id": user_id, "book_id": book["book_id"]})
+        page = client.get(f"/recommend?user_id={user_id}&n=10").json()
+        assert book["book_id"] not in [b["book_id"] for b in page]
+    # Passes re-order the cached candidates; only likes pay for a full rank()
+    assert calls == []
+    assert main.rec_cache._entries[(user_id, ())].swipes == 5
+
+def test_import_skips_heavy_dependencies():
+    # torch is only needed with NEURAL_RANKER=1, and pandas is not on the serving path
+    code = "import sys, app.main; sys.exit(any(m in sys.modules for m in ('torch', 'pandas', 'faiss')))"
+    env = {k: v for k, v in os.environ.items() if k != "NEURAL_RANKER"}
+    assert subprocess.run([sys.executable, "-c", code], env=env).returncode == 0
+
+def test_ready_reports_startup_phases():
+    with TestClient(app) as c:
+        startup.get()
+        response = c.get("/ready")
+        report = response.json()["startup"]
+        if os.path.exists("artifacts/faiss.index"):
+            assert response.status_code == 200
+            assert {"embeddings", "index", "metadata", "total"} <= set(report["phases_s"])
+        else:
+            assert response.status_code == 503
+            assert report["error"]
+
+def test_requests_do_not_wait_for_startup(monkeypatch):
+    loading = StartupState()
+    loading.set_loader(lambda: time.sleep(5))
+    monkeypatch.setattr(main, "startup", loading)
+
+    started = time.perf_counter()
+    assert client.get("/recommend?user_id=u&n=5").status_code == 503
+    assert client.get("/search", params={"q": "anything"}).status_code == 503
+    assert client.get("/health").status_code == 200
+    assert time.perf_counter() - started < 1
+
+def test_health_fails_once_loading_gives_up(monkeypatch):
+    failed = StartupState(max_attempts=1)
+    failed.set_loader(lambda: 1 / 0)
+    failed.get()
+    monkeypatch.setattr(main, "startup", failed)
+
+    assert client.get("/health").status_code == 503
+    assert client.get("/ready").json()["status"] == "error"
+
+@pytest.mark.skipif(not os.path.exists("artifacts/text_index.npz"), reason="Text index not built")
+def test_search(recommender):
+    book_id, meta = next(iter(recommender.books_meta.items()))
+    response = client.get("/search", params={"q": f"{meta['title']} {meta['author']}", "n": 10})
+    assert response.status_code == 200
+    data = response.json()
+    assert book_id in [b["book_id"] for b in data]
+
+@pytest.mark.skipif(not os.path.exists("artifacts/text_index.npz"), reason="Text index not built")
+def test_search_stays_on_query_for_known_users(recommender):
+    user_id = "search_test_user"
+    liked = list(recommender.books_meta)[-5:]
+    for book_id in liked:
+        client.post(f"/user/{user_id}/like", json={"user_id": user_id, "book_id": book_id})
+
+    book_id, meta = next(iter(recommender.books_meta.items()))
+    q = f"{meta['title']} {meta['author']}"
+    anonymous = {b["book_id"] for b in client.get("/search", params={"q": q, "n": 500}).json()}
+    personal = client.get("/search", params={"q": q, "n": 10, "user_id": user_id}).json()
+    # Likes re-order what the query found, they don't add unrelated books
+    assert book_id in [b["book_id"] for b in personal]
+    assert {b["book_id"] for b in personal} <= anonymous
+
+    assert client.get("/search", params={"q": "zzzzqqq", "user_id": user_id}).json() == []
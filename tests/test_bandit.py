@@ -0,0 +1,45 @@
+import numpy as np
+from app.bandit import BanditStore, counts_from_history, fill_quotas, thompson_quotas
+
+def test_counts_from_history():
+    book_arms = np.array([0, 0, 1, 2, -1])
+    book_id_to_idx = {10: 0, 11: 1, 12: 2, 13: 3, 14: 4}
+    counts = counts_from_history(book_arms, book_id_to_idx, 3, liked_ids=[10, 12], seen_ids={10, 11, 12, 13, 14, 99})
+    assert counts.tolist() == [[1, 1], [1, 0], [0, 1]]
+
+def test_quotas_follow_feedback():
+    counts = np.zeros((5, 2), dtype=np.uint32)
+    counts[0] = [20, 0]
+    counts[1] = [0, 20]
+    quotas = thompson_quotas(counts, 200, np.random.default_rng(0))
+    assert quotas.sum() == 200
+    assert quotas[0] > 100
+    assert quotas[1] == 0
+    # Untried genres still get explored
+    assert quotas[2:].sum() > 0
+
+def test_fill_quotas_keeps_score_order():
+    arms = np.array([0, 0, 0, 1, -1, 1, 2])
+    quotas = np.array([2, 1, 0])
+    assert fill_quotas(arms, quotas, 3).tolist() == [0, 1, 3]
+    # Not enough quota-eligible candidates: top up with the best of the rest
+    assert fill_quotas(arms, quotas, 5).tolist() == [0, 1, 2, 3, 4]
+
+def test_store_updates_in_place_and_rebuilds_on_drift():
+    store = BanditStore()
+    rebuilds = []
+
+    def rebuild():
+        rebuilds.append(1)
+        return np.zeros((3, 2), dtype=np.uint32)
+
+    store.record("u1", 0, liked=True)  # unknown user: ignored until first ranking
+    assert store.counts("u1", 0, rebuild).sum() == 0
+    store.record("u1", 1, liked=True)
+    store.record("u1", 2, liked=False)
+    assert store.counts("u1", 2, rebuild).tolist() == [[0, 0], [1, 0], [0, 1]]
+    assert len(rebuilds) == 1
+
+    # Another process handled a swipe: totals disagree, so counters are rebuilt from history
+    store.counts("u1", 3, rebuild)
+    assert len(rebuilds) == 2
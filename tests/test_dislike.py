@@ -0,0 +1,40 @@
+import numpy as np
+from app.dislike import DislikeStore
+from models.infer_ranker import RankerInference
+
+def unit(v):
+    v = np.asarray(v, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+def test_store_updates_in_place_and_rebuilds_on_drift():
+    store = DislikeStore()
+    rebuilds = []
+
+    def rebuild():
+        rebuilds.append(1)
+        return np.zeros(3, dtype=np.float32), 0
+
+    assert store.profile("u1", 0, rebuild) is None
+    store.record("u1", np.array([1, 0, 0], dtype=np.float32), liked=False)
+    store.record("u1", np.array([0, 1, 0], dtype=np.float32), liked=True)
+    store.record("u1", np.array([0, 0, 1], dtype=np.float32), liked=False)
+    np.testing.assert_allclose(store.profile("u1", 3, rebuild), [0.5, 0, 0.5])
+    assert len(rebuilds) == 1
+
+    # Another process handled a swipe: the swipe count disagrees, so the sum is rebuilt from history
+    store.profile("u1", 4, rebuild)
+    assert len(rebuilds) == 2
+
+def test_passed_neighbourhood_is_penalized():
+    ranker = RankerInference(enabled=False, dislike_weight=0.5)
+    user = unit([1, 0, 0])
+    candidates = np.stack([unit([1, 1, 0]), unit([1, 0, 1]), unit([1, -1, 0])])
+    plain = ranker.predict_score(user, candidates)
+    np.testing.assert_allclose(plain, ranker.predict_score(user, candidates, None))
+    # The user passed on a book close to the first candidate
+    scores = ranker.predict_score(user, candidates, unit([0.2, 1, 0]))
+    assert scores[0] < plain[0]
+    assert scores[0] < scores[1]
+    # Books pointing away from the dislike vector are not rewarded
+    np.testing.assert_allclose(scores[2], plain[2])
+    assert ((scores >= 0) & (scores <= 1)).all()
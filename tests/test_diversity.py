@@ -0,0 +1,46 @@
+import numpy as np
+from app.diversity import mmr_rerank
+
+def make_embeddings(n, d=32, seed=0):
+    rng = np.random.default_rng(seed)
+    emb = rng.standard_normal((n, d)).astype(np.float32)
+    return emb / np.linalg.norm(emb, axis=1, keepdims=True)
+
+def test_lambda_one_is_plain_score_order():
+    emb = make_embeddings(50)
+    scores = np.random.default_rng(1).random(50)
+    picked = mmr_rerank(emb, scores, 10, lambda_=1.0)
+    assert list(picked) == list(np.argsort(-scores, kind="stable")[:10])
+
+def test_near_duplicates_are_spread_out():
+    emb = make_embeddings(20)
+    # Items 1 and 2 are copies of item 0 with slightly lower scores
+    emb[1] = emb[0]
+    emb[2] = emb[0]
+    scores = np.linspace(0.6, 0.5, 20)
+    scores[:3] = [0.9, 0.89, 0.88]
+
+    picked = list(mmr_rerank(emb, scores, 5, lambda_=0.5))
+    assert picked[0] == 0
+    assert 1 not in picked[:4] and 2 not in picked[:4]
+
+def test_author_cap_and_fill():
+    emb = make_embeddings(10)
+    scores = np.linspace(1.0, 0.1, 10)
+    authors = np.array([7, 7, 7, 7, 7, 7, 7, 7, 3, -1])
+
+    picked = list(mmr_rerank(emb, scores, 4, lambda_=1.0, author_codes=authors, max_per_author=2))
+    assert picked == [0, 1, 8, 9]
+
+    # Not enough other authors: the rest is filled by score
+    picked = list(mmr_rerank(emb, scores, 6, lambda_=1.0, author_codes=authors, max_per_author=2))
+    assert picked == [0, 1, 8, 9, 2, 3]
+
+def test_author_cap_applies_per_window():
+    emb = make_embeddings(12)
+    scores = np.linspace(1.0, 0.1, 12)
+    authors = np.array([7, 7, 7, 7, 7, 7, 3, 4, 5, 6, 8, 9])
+
+    # At most 2 of author 7 in any 4 consecutive picks; later pages get the author back
+    picked = list(mmr_rerank(emb, scores, 8, lambda_=1.0, author_codes=authors, max_per_author=2, window=4))
+    assert picked == [0, 1, 6, 7, 2, 3, 8, 9]
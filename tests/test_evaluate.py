@@ -0,0 +1,41 @@
+import importlib.util
+import numpy as np
+
+spec = importlib.util.spec_from_file_location("evaluate", "scripts/evaluate.py")
+evaluate = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(evaluate)
+
+def test_recall_and_ndcg():
+    recommended = [5, 1, 7, 2]
+    relevant = {1, 2, 9}
+    assert evaluate.recall_at_n(recommended, relevant, 4) == 2 / 3
+    assert evaluate.recall_at_n(recommended, relevant, 1) == 0.0
+
+    expected = (1 / np.log2(3) + 1 / np.log2(5)) / (1 + 1 / np.log2(3) + 1 / np.log2(4))
+    assert np.isclose(evaluate.ndcg_at_n(recommended, relevant, 4), expected)
+    assert evaluate.ndcg_at_n([1, 2, 9], relevant, 3) == 1.0
+
+def test_db_cases_hold_out_latest_likes(tmp_path):
+    import sqlite3
+    conn = sqlite3.connect(tmp_path / "app.db")
+    conn.execute("CREATE TABLE user_actions (user_id TEXT, book_id INTEGER, action TEXT, timestamp DATETIME, PRIMARY KEY (user_id, book_id))")
+    conn.executemany("INSERT INTO user_actions VALUES (?, ?, ?, ?)", [
+        ("u1", 1, "like", "2024-01-01"), ("u1", 2, "pass", "2024-01-02"),
+        ("u1", 3, "like", "2024-01-03"), ("u1", 4, "like", "2024-01-04"),
+        ("u1", 6, "pass", "2024-01-05"),
+        ("u2", 5, "like", "2024-01-01"),
+    ])
+    conn.commit()
+    conn.close()
+
+    cases = evaluate.cases_from_db(str(tmp_path / "app.db"), holdout=0.2)
+    # u2 has a single like and cannot be split; u1's pass after the held-out like is the future
+    assert cases == [([1, 3], {1, 2, 3}, {4})]
+
+def test_feedback_configs_replay_like_recommend():
+    # The baseline runs with bandit quotas and the dislike penalty, as /recommend does
+    assert evaluate.CONFIGS[evaluate.BASELINE].get("bandit", True)
+    assert evaluate.CONFIGS[evaluate.BASELINE].get("dislike", True)
+    nofeedback = evaluate.CONFIGS["flat-k2000-nofeedback"]
+    assert nofeedback["bandit"] is False and nofeedback["dislike"] is False
+    assert "flat-k2000-nofeedback" in evaluate.DEFAULT_CONFIGS
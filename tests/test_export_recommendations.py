@@ -0,0 +1,63 @@
+import csv
+import sqlite3
+import subprocess
+import sys
+import numpy as np
+import faiss
+
+def make_artifacts(path, num_books=200, dim=16):
+    rng = np.random.default_rng(0)
+    emb = rng.standard_normal((num_books, dim)).astype(np.float32)
+    faiss.normalize_L2(emb)
+    index = faiss.IndexFlatIP(dim)
+    index.add(emb)
+    path.mkdir()
+    np.save(path / "book_embeddings.npy", emb)
+    np.save(path / "book_ids.npy", np.arange(1, num_books + 1) * 10)
+    faiss.write_index(index, str(path / "faiss.index"))
+
+def test_export_skips_seen_books(tmp_path):
+    make_artifacts(tmp_path / "artifacts")
+    conn = sqlite3.connect(tmp_path / "app.db")
+    conn.execute("CREATE TABLE user_actions (user_id TEXT, book_id INTEGER, action TEXT, PRIMARY KEY (user_id, book_id))")
+    actions = [("alice", 10, "like"), ("alice", 20, "like"), ("alice", 30, "pass"),
+               ("bob", 500, "like"), ("carol", 40, "pass")]
+    conn.executemany("INSERT INTO user_actions VALUES (?, ?, ?)", actions)
+    conn.commit()
+    conn.close()
+
+    output = tmp_path / "recs.csv"
+    subprocess.run([
+        sys.executable, "scripts/export_recommendations.py", str(output), "--n", "5",
+        "--db", str(tmp_path / "app.db"), "--artifacts-dir", str(tmp_path / "artifacts"),
+        "--block-size", "1", "--workers", "2",
+    ], check=True)
+
+    with open(output) as f:
+        rows = list(csv.DictReader(f))
+    by_user = {}
+    for row in rows:
+        by_user.setdefault(row["user_id"], []).append(int(row["book_id"]))
+
+    # carol has no likes and is skipped
+    assert set(by_user) == {"alice", "bob"}
+    assert len(by_user["alice"]) == 5
+    assert not {10, 20, 30} & set(by_user["alice"])
+    assert 500 not in by_user["bob"]
+    assert [int(r["rank"]) for r in rows if r["user_id"] == "bob"] == [1, 2, 3, 4, 5]
+
+def test_pool_workers_load_their_own_artifacts(tmp_path):
+    # Under spawn/forkserver a worker starts with an empty _state; _init_pool must fill it
+    import importlib.util
+    spec = importlib.util.spec_from_file_location("export_recommendations", "scripts/export_recommendations.py")
+    export = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(export)
+    make_artifacts(tmp_path / "artifacts")
+
+    assert not export._state
+    export._init_pool(str(tmp_path / "artifacts"))
+    block = (["alice"], np.array([0]), np.array([10]), np.array([True]))
+    users, _, rank, bids, _, skipped = export.score_block(block, 3)
+    assert rank.tolist() == [1, 2, 3]
+    assert 10 not in bids.tolist()
+    assert skipped == 0
@@ -0,0 +1,79 @@
+import numpy as np
+from app.rec_cache import RecommendationCache
+
+def make_ranking(size, start=0):
+    indices = np.arange(start, start + size)
+    return indices, indices + 1000, np.linspace(1.0, 0.5, size)
+
+def test_take_pages_by_offset_and_skips_seen():
+    cache = RecommendationCache()
+    indices, bids, scores = make_ranking(20)
+    cache.put(("u1", ()), indices, bids, scores, profile_version=0)
+
+    first, _ = cache.take(("u1", ()), 0, 0, 5, seen_ids=set())
+    assert list(first) == [0, 1, 2, 3, 4]
+    # Reads have no side effects
+    assert list(cache.take(("u1", ()), 0, 0, 5, seen_ids=set())[0]) == [0, 1, 2, 3, 4]
+    assert list(cache.take(("u1", ()), 0, 5, 5, seen_ids=set())[0]) == [5, 6, 7, 8, 9]
+
+    # The first page was swiped, and book 1005 too
+    swiped = {1000, 1001, 1002, 1003, 1004, 1005}
+    assert list(cache.take(("u1", ()), 0, 0, 5, seen_ids=swiped)[0]) == [6, 7, 8, 9, 10]
+
+    stats = cache.stats()
+    assert stats["hits"] == 4
+    assert stats["hit_rate"] == 1.0
+
+def test_take_misses_when_exhausted_or_unknown():
+    cache = RecommendationCache()
+    indices, bids, scores = make_ranking(6)
+    cache.put(("u1", ()), indices, bids, scores, profile_version=0)
+
+    assert cache.take(("u2", ()), 0, 0, 5, set()) is None
+    assert cache.take(("u1", ()), 0, 0, 5, set()) is not None
+    assert cache.take(("u1", ()), 0, 5, 5, set()) is None
+    assert cache.take(("u1", ()), 0, 0, 5, {1000, 1001}) is None
+
+def test_stale_after_enough_likes():
+    cache = RecommendationCache(refresh_after_likes=3)
+    indices, bids, scores = make_ranking(50)
+    cache.put(("u1", ()), indices, bids, scores, profile_version=2)
+
+    assert cache.take(("u1", ()), 4, 0, 5, set()) is not None
+    # Three likes since it was ranked: the caller must re-rank instead of serving it
+    assert cache.take(("u1", ()), 5, 0, 5, set()) is None
+    # Ranked from a newer profile than the caller's (e.g. a like was undone)
+    assert cache.take(("u1", ()), 1, 0, 5, set()) is None
+
+def test_new_swipes_rescore_the_unseen_remainder():
+    cache = RecommendationCache()
+    indices, bids, scores = make_ranking(20)
+    cache.put(("u1", ()), indices, bids, scores, profile_version=0, swipes=0, user_emb=np.ones((1, 4)))
+    calls = []
+
+    def reverse(user_emb, remaining):
+        calls.append(list(remaining))
+        remaining = remaining[::-1]
+        return remaining, remaining + 1000, np.linspace(1.0, 0.5, len(remaining))
+
+    # Same swipe count: served as cached
+    assert list(cache.take(("u1", ()), 0, 0, 3, set(), swipes=0, rescore=reverse)[0]) == [0, 1, 2]
+    assert calls == []
+    # One pass: only the unseen items are re-scored, once
+    assert list(cache.take(("u1", ()), 0, 0, 3, {1000}, swipes=1, rescore=reverse)[0]) == [19, 18, 17]
+    assert list(cache.take(("u1", ()), 0, 3, 3, {1000}, swipes=1, rescore=reverse)[0]) == [16, 15, 14]
+    assert calls == [list(range(1, 20))]
+
+def test_eviction_bounded_by_memory():
+    indices, bids, scores = make_ranking(200)
+    entry_bytes = RecommendationCache().put(("probe", ()), indices, bids, scores, 0).nbytes
+    cache = RecommendationCache(max_bytes=entry_bytes * 3)
+    for i in range(10):
+        cache.put((f"u{i}", ()), indices, bids, scores, 0)
+
+    stats = cache.stats()
+    assert stats["entries"] == 3
+    assert stats["bytes"] <= stats["max_bytes"]
+    assert stats["evictions"] == 7
+    assert cache.take(("u0", ()), 0, 0, 5, set()) is None
+    assert cache.take(("u9", ()), 0, 0, 5, set()) is not None
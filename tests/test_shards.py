@@ -0,0 +1,88 @@
+import os
+import time
+from multiprocessing import Process
+import numpy as np
+import faiss
+import pytest
+from app.shards import ShardedIndex, ShardUnavailable, ensure_socket_dir, merge_topk, shard_socket_path
+from app.shard_server import serve_shard
+
+AUTHKEY = b"test-shard-key"
+
+def make_embeddings(n=300, d=16):
+    rng = np.random.default_rng(0)
+    emb = rng.standard_normal((n, d)).astype(np.float32)
+    faiss.normalize_L2(emb)
+    return emb
+
+def make_shard(emb, start, end):
+    shard = faiss.IndexIDMap(faiss.IndexFlatIP(emb.shape[1]))
+    shard.add_with_ids(emb[start:end], np.arange(start, end, dtype=np.int64))
+    return shard
+
+def test_merge_topk_matches_single_index():
+    emb = make_embeddings()
+    queries = emb[:4]
+    full = faiss.IndexFlatIP(emb.shape[1])
+    full.add(emb)
+    D_full, I_full = full.search(queries, 10)
+
+    distances, labels = [], []
+    for start, end in [(0, 100), (100, 200), (200, 300)]:
+        D, I = make_shard(emb, start, end).search(queries, 10)
+        distances.append(D)
+        labels.append(I)
+
+    D, I = merge_topk(distances, labels, 10)
+    assert (I == I_full).all()
+    assert np.allclose(D, D_full)
+
+def test_sharded_index_over_unix_sockets(tmp_path):
+    emb = make_embeddings()
+    shards_dir = tmp_path / "shards"
+    socket_dir = tmp_path / "sockets"
+    shards_dir.mkdir()
+    for i, (start, end) in enumerate([(0, 150), (150, 300)]):
+        faiss.write_index(make_shard(emb, start, end), str(shards_dir / f"shard_{i}.index"))
+
+    procs = [Process(target=serve_shard, args=(i, str(shards_dir), str(socket_dir), AUTHKEY), daemon=True) for i in range(2)]
+    for p in procs:
+        p.start()
+    try:
+        deadline = time.time() + 10
+        while not all(os.path.exists(shard_socket_path(str(socket_dir), i)) for i in range(2)):
+            assert time.time() < deadline, "shard servers did not start"
+            time.sleep(0.05)
+
+        index = ShardedIndex.from_dir(str(socket_dir), str(shards_dir), authkey=AUTHKEY)
+        D, I = index.search(emb[[0, 299]], 5)
+        assert I[0, 0] == 0
+        assert I[1, 0] == 299
+        assert os.stat(socket_dir).st_mode & 0o777 == 0o700
+
+        # Clients without the key are turned away at the handshake
+        with pytest.raises(ShardUnavailable):
+            ShardedIndex.from_dir(str(socket_dir), str(shards_dir), authkey=b"wrong", connect_timeout=0)
+
+        # A dead shard is a ShardUnavailable (503), not a hang or a bare socket error
+        procs[1].terminate()
+        procs[1].join()
+        with pytest.raises(ShardUnavailable):
+            for _ in range(2):
+                # The first call may still use the pooled connection to the old process
+                index.search(emb[[0]], 5)
+    finally:
+        for p in procs:
+            p.terminate()
+
+def test_socket_dir_must_be_a_private_directory(tmp_path):
+    loose = tmp_path / "loose"
+    loose.mkdir(mode=0o777)
+    os.chmod(loose, 0o777)
+    ensure_socket_dir(str(loose))
+    assert os.stat(loose).st_mode & 0o777 == 0o700
+
+    planted = tmp_path / "planted"
+    planted.symlink_to(loose)
+    with pytest.raises(PermissionError):
+        ensure_socket_dir(str(planted))
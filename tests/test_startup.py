@@ -0,0 +1,32 @@
+import time
+from app.startup import StartupState
+
+def test_failed_load_is_retried():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError("shards not up")
+        return "loaded"
+
+    state = StartupState(max_attempts=3, retry_delay=0.01)
+    state.set_loader(flaky)
+    assert state.get() == "loaded"
+    assert state.ready and not state.failed
+    assert state.report()["attempts"] == 3
+    assert state.error is None
+
+def test_gives_up_after_max_attempts():
+    state = StartupState(max_attempts=2, retry_delay=0.01)
+    state.set_loader(lambda: 1 / 0)
+    assert state.get() is None
+    assert state.failed and not state.ready
+    assert state.report()["attempts"] == 2
+    assert "division" in state.error
+
+def test_get_does_not_wait_with_zero_timeout():
+    state = StartupState()
+    state.set_loader(lambda: time.sleep(1))
+    assert state.get(timeout=0) is None
+    assert not state.ready and not state.failed
@@ -0,0 +1,54 @@
+import numpy as np
+from app.text_index import TextIndex, build_text_index, save_text_index, reciprocal_rank_fusion, tokenize
+
+TEXTS = [
+    "the hunger games suzanne collins young adult dystopia",
+    "catching fire suzanne collins young adult",
+    "the hobbit j.r.r. tolkien fantasy classics",
+    "the lord of the rings tolkien fantasy fantasy fantasy",
+]
+
+def make_index(tmp_path):
+    path = tmp_path / "text_index.npz"
+    save_text_index(path, build_text_index(TEXTS, [10, 11, 12, 13]))
+    return TextIndex.load(path)
+
+def test_tokenize():
+    assert tokenize("The Hobbit (J.R.R. Tolkien, #1)") == ["the", "hobbit", "j", "r", "r", "tolkien", "1"]
+
+def test_search_ranks_matching_books(tmp_path):
+    index = make_index(tmp_path)
+
+    rows, scores = index.search("hobbit", 5)
+    assert index.book_ids[rows].tolist() == [12]
+
+    rows, scores = index.search("Suzanne Collins hunger", 5)
+    assert index.book_ids[rows].tolist() == [10, 11]
+    assert scores[0] > scores[1] > 0
+
+    rows, _ = index.search("tolkien", 1)
+    assert len(rows) == 1
+
+    rows, _ = index.search("nonexistent words", 5)
+    assert len(rows) == 0
+
+def test_sparse_and_dense_accumulation_agree(tmp_path, monkeypatch):
+    import app.text_index as text_index
+    index = make_index(tmp_path)
+    queries = ["suzanne collins fantasy", "the tolkien", "the fire"]
+    # Postings merged by sorting, however many docs they cover
+    monkeypatch.setattr(text_index, "SPARSE_FRACTION", 0)
+    sparse = [index.search(q, 5) for q in queries]
+    # Postings covering a large part of the catalog use a dense accumulator
+    monkeypatch.setattr(text_index, "SPARSE_FRACTION", len(TEXTS) + 1)
+    dense = [index.search(q, 5) for q in queries]
+    for (rows_s, scores_s), (rows_d, scores_d) in zip(sparse, dense):
+        assert rows_s.tolist() == rows_d.tolist()
+        assert np.allclose(scores_s, scores_d)
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]], k=60)
+    ids = [item for item, _ in fused]
+    assert ids[0] == 1
+    assert set(ids) == {1, 2, 3, 4}
+    assert np.isclose(dict(fused)[3], 1 / 63 + 1 / 61)
@@ -0,0 +1,85 @@
+import os
+import sqlite3
+import pytest
+from app import worker
+
+@pytest.fixture
+def db(tmp_path):
+    conn = sqlite3.connect(tmp_path / "app.db")
+    conn.execute("""
+    CREATE TABLE user_actions (
+        user_id TEXT,
+        book_id INTEGER,
+        action TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, book_id)
+    )
+    """)
+    worker.ensure_schema(conn)
+    yield conn
+    conn.close()
+
+def test_events_are_coalesced_per_user(db):
+    for _ in range(3):
+        worker.enqueue_profile_change(db, "u1")
+    worker.enqueue_profile_change(db, "u2")
+    db.commit()
+    assert worker.backlog_stats(db)["pending_users"] == 2
+
+    assert worker.claim_batch(db, 10) == ["u1", "u2"]
+    assert worker.backlog_stats(db)["pending_users"] == 0
+
+def test_backlog_is_trimmed_to_bound(db):
+    for i in range(10):
+        db.execute("INSERT INTO profile_events (user_id, enqueued_at) VALUES (?, ?)", (f"u{i}", float(i)))
+    db.commit()
+
+    assert worker.trim_backlog(db, 4) == 6
+    # The newest events survive
+    assert worker.claim_batch(db, 10) == ["u6", "u7", "u8", "u9"]
+
+@pytest.mark.skipif(not os.path.exists("artifacts/faiss.index"), reason="Index not built")
+def test_worker_precomputes_rankings(db, tmp_path):
+    db.execute("INSERT INTO user_actions (user_id, book_id, action) VALUES ('u1', 1, 'like')")
+    db.execute("INSERT INTO user_actions (user_id, book_id, action) VALUES ('u1', 2, 'pass')")
+    worker.enqueue_profile_change(db, "u1")
+    db.commit()
+
+    assert worker.run(str(tmp_path / "app.db"), workers=1, once=True) == 1
+
+    version, bids, scores = worker.read_precomputed(db, "u1")
+    # Versioned by like count, like the API's session cache
+    assert version == 1
+    assert len(bids) == worker.PRECOMPUTE_DEPTH
+    assert not {1, 2} & set(bids.tolist())
+    # Diversity re-ranking reorders the list, but the first pick is always the best match
+    assert scores[0] == scores.max()
+
+def _init_noop(db_path, shard_socket_dir=None):
+    pass
+
+def _recompute_or_fail(user_id):
+    if user_id == "broken":
+        raise sqlite3.OperationalError("database is locked")
+    return user_id
+
+def test_failed_users_are_requeued_without_stopping_the_worker(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(worker, "_init_worker", _init_noop)
+    monkeypatch.setattr(worker, "_recompute_user", _recompute_or_fail)
+    for user_id in ("u1", "broken", "u2"):
+        worker.enqueue_profile_change(db, user_id)
+    db.commit()
+
+    # The failing user is retried MAX_ATTEMPTS times, then dropped; the others still get processed
+    assert worker.run(str(tmp_path / "app.db"), workers=1, once=True) == 2
+    assert worker.backlog_stats(db)["pending_users"] == 0
+
+def test_workers_use_the_shard_servers(monkeypatch, tmp_path):
+    import app.recommender
+    built = {}
+    # _init_worker sets these per-process globals; restore them afterwards
+    monkeypatch.setattr(worker, "_recommender", None)
+    monkeypatch.setattr(worker, "_db_path", worker._db_path)
+    monkeypatch.setattr(app.recommender, "Recommender", lambda **kwargs: built.update(kwargs))
+    worker._init_worker(str(tmp_path / "app.db"), "/tmp/bookswipe-shards")
+    assert built == {"shard_socket_dir": "/tmp/bookswipe-shards"}